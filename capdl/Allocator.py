@@ -13,6 +13,9 @@ from Object import Frame, PageTable, PageDirectory, CNode, Endpoint, \
     VCPU
 from Spec import Spec
 from Cap import Cap
+from Arch import get_arch
+from util import ceil_log2
+import heapq
 
 seL4_UntypedObject = 0
 seL4_TCBObject = 1
@@ -46,6 +49,77 @@ seL4_CanWrite = 2
 seL4_CanGrant = 4
 seL4_AllRights = seL4_CanRead|seL4_CanWrite|seL4_CanGrant
 
+def _frame(size):
+    return lambda allocator, name, **kwargs: Frame(name, size, **kwargs)
+
+def _io_ports(allocator, name, **kwargs):
+    # There is only one IOPort object in the system, which describes the
+    # entire port region.
+    for o in allocator.spec.of_type(IOPorts):
+        return o
+    return IOPorts(name)
+
+def _irq(allocator, name, **kwargs):
+    if 'number' in kwargs and 'aep' in kwargs:
+        o = IRQ(name, kwargs['number'])
+        o.set_endpoint(kwargs['aep'])
+        return o
+    else:
+        raise ValueError
+
+# Constructors for each type of object, keyed on the seL4 type constant. Each
+# is called with the allocator, the name of the object and the extra keyword
+# arguments passed to alloc. A constructor may return an object that is
+# already in the allocator's spec, in which case it is returned unchanged.
+_constructors = {
+    seL4_UntypedObject:lambda allocator, name, **kwargs:
+        Untyped(name, kwargs.get('size_bits', 12)),
+    seL4_TCBObject:lambda allocator, name, **kwargs: TCB(name),
+    seL4_EndpointObject:lambda allocator, name, **kwargs: Endpoint(name),
+    seL4_AsyncEndpointObject:lambda allocator, name, **kwargs:
+        AsyncEndpoint(name),
+    seL4_CapTableObject:lambda allocator, name, **kwargs: CNode(name, **kwargs),
+    seL4_FrameObject:_frame(4096),
+    seL4_IA32_4K:_frame(4096), # 4K
+    seL4_ARM_SmallPageObject:_frame(4096), # 4K
+    seL4_ARM_LargePageObject:_frame(64 * 1024), # 64K
+    seL4_ARM_SectionObject:_frame(1024 * 1024), # 1M
+    seL4_ARM_SuperSectionObject:_frame(16 * 1024 * 1024), # 16M
+    seL4_IA32_4M:_frame(4096 * 1024), # 4M
+    seL4_IA32_PageTableObject:lambda allocator, name, **kwargs:
+        PageTable(name),
+    seL4_ARM_PageTableObject:lambda allocator, name, **kwargs:
+        PageTable(name),
+    seL4_IA32_PageDirectoryObject:lambda allocator, name, **kwargs:
+        PageDirectory(name),
+    seL4_ARM_PageDirectoryObject:lambda allocator, name, **kwargs:
+        PageDirectory(name),
+    seL4_PageDirectoryObject:lambda allocator, name, **kwargs:
+        PageDirectory(name),
+    seL4_IA32_IOPageTableObject:lambda allocator, name, **kwargs:
+        IOPageTable(name),
+    seL4_IA32_IOPort:_io_ports,
+    seL4_IA32_IOSpace:lambda allocator, name, **kwargs:
+        IODevice(name, **kwargs),
+    seL4_IA32_VCPU:lambda allocator, name, **kwargs: VCPU(name),
+    seL4_IRQControl:_irq,
+}
+
+# Types of which there is only one object, which alloc returns every time.
+_singletons = set([seL4_IA32_IOPort])
+
+def register_object_type(type, constructor, singleton=False):
+    '''
+    Teach ObjectAllocator to allocate a new type of object. See _constructors
+    for how 'constructor' is called. A constructor for a 'singleton' type
+    returns the existing object of that type if there is one.
+    '''
+    _constructors[type] = constructor
+    if singleton:
+        _singletons.add(type)
+    else:
+        _singletons.discard(type)
+
 class ObjectAllocator(object):
     '''
     An offline object allocator. This can be useful for incrementally
@@ -56,92 +130,80 @@ class ObjectAllocator(object):
         self.prefix = prefix
         self.counter = 0
         self.spec = Spec()
-        self.labels = {}
-        self.name_to_object = {}
 
-    def _assign_label(self, label, obj):
-        if label not in self.labels:
-            self.labels[label] = set()
-        self.labels[label].add(obj)
+    @property
+    def name_to_object(self):
+        # A snapshot of the spec's name index, retained for existing callers.
+        # Look objects up with spec.by_name instead.
+        return dict((o.name, o) for o in self.spec)
+
+    @property
+    def labels(self):
+        # A snapshot mapping each label to the set of objects with that
+        # label, retained for existing callers. Use spec.by_label instead.
+        return dict((label, set(self.spec.by_label(label)))
+            for label in self.spec.labels())
 
     def relabel(self, label, obj):
-        for l in self.labels:
-            if obj in self.labels[l]:
-                self.labels[l].remove(obj)
-                break
-        self._assign_label(label, obj)
+        self.spec.relabel(obj, label)
+
+    def _constructor(self, type):
+        constructor = _constructors.get(type)
+        if constructor is None:
+            raise Exception('Invalid object type %s' % type)
+        return constructor
 
     def alloc(self, type, name=None, label=None, **kwargs):
         if name is None:
             name = '%s%d' % (self.prefix, self.counter)
 
-        o = self.name_to_object.get(name)
+        o = self.spec.by_name(name)
         if not o is None:
-            assert o in self.labels.get(label, set()), \
+            assert self.spec.label_of(o) == label, \
                 'attempt to allocate object %s under a new, differing label' % o.name
             return o
 
         self.counter += 1
-        if type == seL4_UntypedObject:
-            size_bits = kwargs.get('size_bits', 12)
-            o = Untyped(name, size_bits)
-        elif type == seL4_TCBObject:
-            o = TCB(name)
-        elif type == seL4_EndpointObject:
-            o = Endpoint(name)
-        elif type == seL4_AsyncEndpointObject:
-            o = AsyncEndpoint(name)
-        elif type == seL4_CapTableObject:
-            o = CNode(name, **kwargs)
-        elif type == seL4_FrameObject:
-            o = Frame(name, 4096, **kwargs)
-        elif type == seL4_IA32_4K or type == seL4_ARM_SmallPageObject:
-            o = Frame(name, 4096, **kwargs) # 4K
-        elif type == seL4_ARM_LargePageObject:
-            o = Frame(name, 64 * 1024, **kwargs) # 64K
-        elif type == seL4_ARM_SectionObject:
-            o = Frame(name, 1024 * 1024, **kwargs) # 1M
-        elif type == seL4_ARM_SuperSectionObject:
-            o = Frame(name, 16 * 1024 * 1024, **kwargs) # 16M
-        elif type == seL4_IA32_PageTableObject or type == seL4_ARM_PageTableObject:
-            o = PageTable(name)
-        elif type in [seL4_IA32_PageDirectoryObject,
-                      seL4_ARM_PageDirectoryObject,
-                      seL4_PageDirectoryObject]:
-            o = PageDirectory(name)
-        elif type == seL4_IA32_4M:
-            o = Frame(name, 4096 * 1024, **kwargs) # 4M
-        elif type == seL4_IA32_IOPageTableObject:
-            o = IOPageTable(name)
-        elif type == seL4_IA32_IOPort:
-            # There is only one IOPort object in the system, which describes the entire
-            # port region.
-            for o in self:
-                if isinstance(o, IOPorts):
-                    return o
-            o = IOPorts(name)
-        elif type == seL4_IA32_IOSpace:
-            o = IODevice(name, **kwargs)
-        elif type == seL4_IA32_VCPU:
-            o = VCPU(name)
-        elif type == seL4_IRQControl:
-            if 'number' in kwargs and 'aep' in kwargs:
-                o = IRQ(name, kwargs['number'])
-                o.set_endpoint(kwargs['aep'])
-            else:
-                raise ValueError
-        else:
-            raise Exception('Invalid object type %s' % type)
-        self.spec.add_object(o)
-        self.name_to_object.update({name:o})
-        self._assign_label(label, o)
+        o = self._constructor(type)(self, name, **kwargs)
+        if o in self.spec:
+            return o
+        self.spec.add_object(o, label)
         return o
 
+    def alloc_many(self, type, count, name_fmt=None, label=None, **kwargs):
+        '''
+        Allocate 'count' objects of the same type, with the same label and
+        extra arguments, returning them in a list. Objects are named by
+        formatting 'name_fmt' with their position in the list, or as alloc
+        names them if 'name_fmt' is not given. This is equivalent to calling
+        alloc in a loop, but the spec and label indexes are updated in bulk.
+        '''
+        constructor = self._constructor(type)
+        if name_fmt is None:
+            names = ['%s%d' % (self.prefix, i)
+                for i in xrange(self.counter, self.counter + count)]
+        else:
+            names = [name_fmt % i for i in xrange(count)]
+
+        if type in _singletons or \
+           any(self.spec.by_name(name) is not None for name in names):
+            # Some of these objects already exist, or may do once the first
+            # is allocated. This is rare enough that it is not worth
+            # handling specially.
+            return [self.alloc(type, None if name_fmt is None else name,
+                label, **kwargs) for name in names]
+
+        self.counter += count
+        objs = [constructor(self, name, **kwargs) for name in names]
+        # Constructors may return existing objects, which keep their labels.
+        new = [o for o in objs if o not in self.spec]
+        self.spec.add_objects(new, label)
+        return objs
+
     def merge(self, spec, label=None):
         assert isinstance(spec, Spec)
-        self.spec.merge(spec)
-        [self._assign_label(label, x) for x in spec.objs]
-        [self.name_to_object.update({x.name:x}) for x in spec]
+        for x in spec:
+            self.spec.add_object(x, label)
 
     def __getitem__(self, key):
         return self.spec[key]
@@ -153,6 +215,12 @@ class CSpaceAllocator(object):
     '''
     An offline CSpace allocator. Note that this is only capable of allocating
     from a single level CSpace.
+
+    The allocator works alongside callers that populate or clear slots of the
+    CNode directly. Slots are handed out from a cursor that only moves
+    forwards, with slots freed through the allocator reused first. Slots
+    cleared directly by the caller are found again when the cursor reaches
+    the end of the CNode.
     '''
 
     def __init__(self, cnode):
@@ -160,6 +228,52 @@ class CSpaceAllocator(object):
         self.cnode = cnode
         self.objname_to_slot = {}
         self.slot = 1 # Skip the null slot
+        # Free slots below the cursor, as a min-heap. Entries may be stale if
+        # the caller has since populated the slot.
+        self._free = []
+
+    def _capacity(self):
+        if self.cnode.size_bits == 'auto':
+            return None
+        return 1 << self.cnode.size_bits
+
+    def _next_free(self):
+        slots = self.cnode.slots
+        while self._free:
+            slot = heapq.heappop(self._free)
+            if slot not in slots:
+                return slot
+        while self.slot in slots:
+            # Skip slots the caller may have manually populated.
+            self.slot += 1
+        capacity = self._capacity()
+        if capacity is None or self.slot < capacity:
+            slot = self.slot
+            self.slot += 1
+            return slot
+
+        # The cursor has reached the end of the CNode. If it isn't full, the
+        # caller must have cleared some slots directly, so find them all.
+        used = len(slots) - (1 if 0 in slots else 0)
+        if used >= capacity - 1:
+            # Ran out of space in the CNode.
+            return -1
+        self._free = [x for x in xrange(1, capacity) if x not in slots]
+        return heapq.heappop(self._free)
+
+    def _make_cap(self, obj, **kwargs):
+        if 'rights' in kwargs:
+            assert 'read' not in kwargs
+            assert 'write' not in kwargs
+            assert 'grant' not in kwargs
+            read = kwargs['rights'] & seL4_CanRead > 0
+            write = kwargs['rights'] & seL4_CanWrite > 0
+            grant = kwargs['rights'] & seL4_CanGrant > 0
+        else:
+            read = kwargs.get('read', False)
+            write = kwargs.get('write', False)
+            grant = kwargs.get('grant', False)
+        return Cap(obj, read=read, write=write, grant=grant)
 
     def alloc(self, obj, **kwargs):
         '''
@@ -168,7 +282,8 @@ class CSpaceAllocator(object):
         indicating a cap with no rights, (b) the extra parameter 'rights' set
         to one of 0/seL4_CanRead/seL4_CanWrite/seL4_CanGrant/seL4_AllRights,
         or (c) some combination of the boolean parameters 'read', 'write' and
-        'grant' indicating the rights of the cap.
+        'grant' indicating the rights of the cap. Returns -1 if the CNode is
+        full.
         '''
         assert isinstance(obj, Object) or obj is None
 
@@ -179,31 +294,232 @@ class CSpaceAllocator(object):
             if not slot is None:
                 return slot
 
-        while self.slot in self.cnode.slots:
-            # Skip slots the caller may have manually populated.
-            self.slot += 1
-        if self.cnode.size_bits != 'auto' and self.slot > (1 << self.cnode.size_bits) - 1:
-            # Ran out of space in the CNode.
+        slot = self._next_free()
+        if slot == -1:
             return -1
-        slot = self.slot
-        self.slot += 1
         if obj is None:
             # The caller requested just a free slot.
             cap = None
         else:
-            if 'rights' in kwargs:
-                assert 'read' not in kwargs
-                assert 'write' not in kwargs
-                assert 'grant' not in kwargs
-                read = kwargs['rights'] & seL4_CanRead > 0
-                write = kwargs['rights'] & seL4_CanWrite > 0
-                grant = kwargs['rights'] & seL4_CanGrant > 0
-            else:
-                read = kwargs.get('read', False)
-                write = kwargs.get('write', False)
-                grant = kwargs.get('grant', False)
-            cap = Cap(obj, read=read, write=write, grant=grant)
+            cap = self._make_cap(obj, **kwargs)
         self.cnode[slot] = cap
         if not obj is None:
             self.objname_to_slot.update({obj.name: slot})
         return slot
+
+    def alloc_range(self, count):
+        '''
+        Reserve 'count' contiguous free slots, returning the first of them or
+        -1 if there is no large enough run. The slots hold no caps until the
+        caller populates them.
+        '''
+        assert count > 0
+        slots = self.cnode.slots
+        capacity = self._capacity()
+
+        def find(start, limit):
+            run = 0
+            slot = start
+            while limit is None or slot < limit:
+                if slot in slots:
+                    run = 0
+                else:
+                    run += 1
+                    if run == count:
+                        return slot - count + 1
+                slot += 1
+            return -1
+
+        # Look beyond the cursor first, as that is where free slots are most
+        # likely to be, then in the slots that have been freed.
+        first = find(self.slot, capacity)
+        if first == -1:
+            first = find(1, min(self.slot + count - 1, capacity))
+        if first == -1:
+            return -1
+        for slot in xrange(first, first + count):
+            self.cnode[slot] = None
+        return first
+
+    def reserve(self, slot):
+        '''
+        Mark a specific slot as in use without putting a cap in it. The slot
+        must be free.
+        '''
+        capacity = self._capacity()
+        assert slot > 0, 'the null slot cannot be reserved'
+        assert capacity is None or slot < capacity, \
+            'slot %d is beyond the end of the CNode' % slot
+        assert slot not in self.cnode.slots, 'slot %d is in use' % slot
+        self.cnode[slot] = None
+
+    def free(self, slot):
+        '''
+        Clear a slot, making it available for reuse.
+        '''
+        assert slot > 0, 'the null slot cannot be freed'
+        if slot in self.cnode.slots:
+            cap = self.cnode[slot]
+            del self.cnode[slot]
+            if cap is not None and \
+               self.objname_to_slot.get(cap.referent.name) == slot:
+                del self.objname_to_slot[cap.referent.name]
+        if slot < self.slot:
+            heapq.heappush(self._free, slot)
+
+# Minimum CNode size, in bits.
+MIN_CNODE_BITS = 2
+
+def cspace_layout(slots, arch='arm11'):
+    '''
+    Choose the shape of a CSpace with room for 'slots' caps that uses the
+    least CNode memory on the given architecture. Returns a pair (root_bits, leaf_bits), describing a
+    root CNode of 2 ** root_bits slots each holding a cap to a leaf CNode of
+    2 ** leaf_bits slots. A root_bits of 0 means a single CNode of leaf_bits
+    is best. Slot 0 of every leaf is left empty, as CSpaceAllocator does.
+    '''
+    assert slots > 0
+    word_bits = get_arch(arch).word_bits
+    bits = max(MIN_CNODE_BITS, ceil_log2(slots + 1))
+    best = (1 << bits, 0, bits)
+    for leaf_bits in xrange(MIN_CNODE_BITS, word_bits):
+        leaves = (slots + (1 << leaf_bits) - 2) / ((1 << leaf_bits) - 1)
+        if leaves == 1:
+            # A single leaf needs no root.
+            break
+        root_bits = max(MIN_CNODE_BITS, ceil_log2(leaves))
+        if root_bits + leaf_bits > word_bits:
+            continue
+        total = (1 << root_bits) + leaves * (1 << leaf_bits)
+        if total < best[0]:
+            best = (total, root_bits, leaf_bits)
+    return best[1:]
+
+class MultiLevelCSpaceAllocator(object):
+    '''
+    An offline allocator for a CSpace of up to two levels. It returns CPtrs
+    rather than slot indices. Leaf CNodes are created as they are needed,
+    with the layout chosen by cspace_layout to minimise CNode memory for the
+    expected number of slots.
+
+    Guards are chosen so that every CPtr resolves in exactly as many bits as
+    there are in a word of 'arch', which defaults to the architecture of
+    obj_allocator's spec. All of the guard is on the cap to the root, so
+    install root_cap() as the CSpace of the threads that use this CSpace. If
+    'obj_allocator' is given, CNodes are allocated from it under 'label'.
+    Either way they are listed in 'cnodes'.
+    '''
+
+    def __init__(self, name, slots, obj_allocator=None, label=None,
+            arch=None):
+        self.name = name
+        self.obj_allocator = obj_allocator
+        self.label = label
+        if arch is None:
+            arch = 'arm11' if obj_allocator is None else \
+                obj_allocator.spec.arch
+        self.arch = get_arch(arch)
+        self.cnodes = []
+        self.objname_to_cptr = {}
+        self.root_bits, self.leaf_bits = cspace_layout(slots, arch)
+        if self.root_bits == 0:
+            self.root = self._cnode(name, self.leaf_bits)
+            self._leaves = [CSpaceAllocator(self.root)]
+        else:
+            self.root = self._cnode(name, self.root_bits)
+            self._leaves = []
+        # The leaf allocated from most recently.
+        self._current = 0
+
+    def _cnode(self, name, size_bits):
+        if self.obj_allocator is not None:
+            cnode = self.obj_allocator.alloc(seL4_CapTableObject, name,
+                self.label, size_bits=size_bits)
+        else:
+            cnode = CNode(name, size_bits)
+        self.cnodes.append(cnode)
+        return cnode
+
+    def _add_leaf(self):
+        index = len(self._leaves)
+        if index >= 1 << self.root_bits:
+            return False
+        leaf = self._cnode('%s_%d' % (self.name, index), self.leaf_bits)
+        cap = Cap(leaf)
+        cap.set_guard(0)
+        cap.set_guard_size(0)
+        self.root[index] = cap
+        self._leaves.append(CSpaceAllocator(leaf))
+        return True
+
+    def root_cap(self):
+        '''
+        A cap to the root CNode, with the guard that makes CPtrs resolve in a
+        word.
+        '''
+        cap = Cap(self.root)
+        cap.set_guard(0)
+        cap.set_guard_size(self.arch.word_bits - self.root_bits -
+            self.leaf_bits)
+        return cap
+
+    def alloc(self, obj, **kwargs):
+        '''
+        Allocate a cap referencing the given object, as for
+        CSpaceAllocator.alloc, and return its CPtr. Returns -1 if the CSpace
+        is full.
+        '''
+        if not obj is None and not isinstance(obj, IOPorts):
+            cptr = self.objname_to_cptr.get(obj.name)
+            if not cptr is None:
+                return cptr
+
+        while True:
+            if self._current < len(self._leaves):
+                slot = self._leaves[self._current].alloc(obj, **kwargs)
+                if slot != -1:
+                    break
+            if self._add_leaf():
+                self._current = len(self._leaves) - 1
+                continue
+            # Every leaf we can have exists, so look for space freed in
+            # them.
+            for index, leaf in enumerate(self._leaves):
+                slot = leaf.alloc(obj, **kwargs)
+                if slot != -1:
+                    self._current = index
+                    break
+            else:
+                return -1
+            break
+
+        cptr = (self._current << self.leaf_bits) | slot
+        if not obj is None:
+            self.objname_to_cptr[obj.name] = cptr
+        return cptr
+
+    def _resolve(self, cptr):
+        return self._leaves[cptr >> self.leaf_bits], \
+            cptr & ((1 << self.leaf_bits) - 1)
+
+    def free(self, cptr):
+        '''
+        Clear the slot at 'cptr', making it available for reuse.
+        '''
+        leaf, slot = self._resolve(cptr)
+        if slot in leaf.cnode.slots and leaf.cnode[slot] is not None:
+            name = leaf.cnode[slot].referent.name
+            if self.objname_to_cptr.get(name) == cptr:
+                del self.objname_to_cptr[name]
+        leaf.free(slot)
+
+    def __getitem__(self, cptr):
+        leaf, slot = self._resolve(cptr)
+        return leaf.cnode[slot]
+
+    def memory(self):
+        '''
+        The total size of the CNodes in this CSpace, in bytes.
+        '''
+        slot_bits = self.arch.slot_bits
+        return sum(1 << (x.size_bits + slot_bits) for x in self.cnodes)
@@ -0,0 +1,161 @@
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+"""
+Descriptions of the architectures we generate specs for. These are built once
+and looked up by name, so the paging arithmetic done for every page is just
+shifts and masks.
+"""
+
+class Level(object):
+    """
+    One level of an architecture's paging structures. 'kind' is the CapDL
+    name of the type of table at this level. Entries of the table are indexed
+    by 'bits' bits of the virtual address, starting at bit 'shift'.
+    """
+    def __init__(self, kind, shift, bits):
+        self.kind = kind
+        self.shift = shift
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        # The number of bytes mapped by one entry, and by the whole table.
+        self.entry_size = 1 << shift
+        self.coverage = 1 << (shift + bits)
+
+    def index(self, vaddr):
+        return (vaddr >> self.shift) & self.mask
+
+    def base(self, vaddr):
+        """
+        The base virtual address of the table at this level covering vaddr.
+        """
+        return vaddr & ~(self.coverage - 1)
+
+class Arch(object):
+    """
+    An architecture. The paging structures are given by 'levels', from the
+    root of the address space down to page tables. 'large_pages' lists the
+    frames larger than a page that can be mapped, largest first, each as a
+    pair (size, depth) giving the level of the table it is mapped into.
+    'object_sizes' maps the CapDL name of each type of object whose size is
+    fixed to its size as a power of two.
+    """
+    def __init__(self, name, word_bits, levels, large_pages, slot_bits,
+            object_sizes):
+        self.name = name
+        self.word_bits = word_bits
+        self.levels = levels
+        self.large_pages = large_pages
+        self.slot_bits = slot_bits
+        self.object_sizes = object_sizes
+        self.page_table = levels[-1]
+        self.page_directory = levels[-2]
+
+ARM = Arch('arm11', 32,
+    levels=[Level('pd', 20, 12), Level('pt', 12, 8)],
+    large_pages=[
+        (16 * 1024 * 1024, 0), # Supersections
+        (1 * 1024 * 1024, 0), # Sections
+        (64 * 1024, 1), # Large pages
+    ],
+    slot_bits=4,
+    object_sizes={
+        'tcb':9,
+        'ep':4,
+        'aep':4,
+        'pt':10,
+        'pd':14,
+        'asid_pool':12,
+    })
+
+IA32 = Arch('ia32', 32,
+    levels=[Level('pd', 22, 10), Level('pt', 12, 10)],
+    large_pages=[
+        (4 * 1024 * 1024, 0), # 4M pages
+    ],
+    slot_bits=4,
+    object_sizes={
+        'tcb':10,
+        'ep':4,
+        'aep':4,
+        'pt':12,
+        'pd':12,
+        'asid_pool':12,
+        'io_pt':12,
+        'vcpu':12,
+    })
+
+X86_64 = Arch('x86_64', 64,
+    levels=[Level('pml4', 39, 9), Level('pdpt', 30, 9), Level('pd', 21, 9),
+        Level('pt', 12, 9)],
+    large_pages=[
+        (1024 * 1024 * 1024, 1), # 1G pages
+        (2 * 1024 * 1024, 2), # 2M pages
+    ],
+    slot_bits=5,
+    object_sizes={
+        'tcb':11,
+        'ep':4,
+        'aep':5,
+        'pt':12,
+        'pd':12,
+        'pdpt':12,
+        'pml4':12,
+        'asid_pool':12,
+        'io_pt':12,
+        'vcpu':12,
+    })
+
+AARCH64 = Arch('aarch64', 64,
+    levels=[Level('pgd', 39, 9), Level('pud', 30, 9), Level('pd', 21, 9),
+        Level('pt', 12, 9)],
+    large_pages=[
+        (1024 * 1024 * 1024, 1), # 1G blocks
+        (2 * 1024 * 1024, 2), # 2M blocks
+    ],
+    slot_bits=5,
+    object_sizes={
+        'tcb':11,
+        'ep':4,
+        'aep':5,
+        'pt':12,
+        'pd':12,
+        'pud':12,
+        'pgd':12,
+        'asid_pool':12,
+    })
+
+# Architectures by name, including the names pyelftools uses.
+_arches = {
+    'arm':ARM,
+    'arm11':ARM,
+    'x86':IA32,
+    'ia32':IA32,
+    'x64':X86_64,
+    'x86_64':X86_64,
+    'aarch64':AARCH64,
+}
+
+def get_arch(name):
+    """
+    The architecture with the given name, in any case.
+    """
+    arch = _arches.get(name)
+    if arch is None:
+        arch = _arches.get(name.lower())
+        if arch is None:
+            # NB: If you end up here while dealing with an ELF that you are
+            # reasonably sure is ARM, chances are you don't have a recent
+            # enough version of pyelftools. ARM support was only added
+            # recently.
+            raise NotImplementedError
+        # Remember this spelling, so it is found directly next time.
+        _arches[name] = arch
+    return arch
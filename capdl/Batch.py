@@ -0,0 +1,104 @@
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+"""
+Generating a single spec from many ELF files, using a pool of processes.
+This can also be run as a script:
+
+    python -m capdl.Batch [-j JOBS] [-o OUTPUT] [--binary] ELF[=NAME]...
+"""
+
+from ELF import ELF
+from Spec import Spec
+import Binary
+import argparse, multiprocessing, os, sys
+
+def _elf_spec(job):
+    '''
+    Worker for get_spec. Specs are passed back to the parent in their binary
+    encoding, which is much cheaper to pickle than the object graph.
+    '''
+    path, name, infer_tcb, infer_asid = job
+    return Binary.dumps(ELF(path, name).get_spec(infer_tcb, infer_asid))
+
+def get_spec(elfs, infer_tcb=True, infer_asid=True, processes=None):
+    '''
+    Generate a spec for each of the (path, name) pairs in 'elfs' and merge
+    them into a single spec. The objects from each ELF file are labelled with
+    its name. ELF files are processed in parallel by 'processes' worker
+    processes, defaulting to one per CPU, but the result does not depend on
+    how many there are.
+    '''
+    elfs = list(elfs)
+    jobs = [(path, name, infer_tcb, infer_asid) for path, name in elfs]
+
+    pool = None
+    if processes == 1 or len(jobs) <= 1:
+        results = (_elf_spec(job) for job in jobs)
+    else:
+        pool = multiprocessing.Pool(processes)
+        # imap returns results in order, so the merged spec is the same
+        # regardless of which worker finishes first.
+        results = pool.imap(_elf_spec, jobs)
+
+    try:
+        spec = None
+        for (path, name), data in zip(elfs, results):
+            s = Binary.loads(data)
+            if spec is None:
+                spec = Spec(s.arch)
+            elif s.arch != spec.arch:
+                raise Exception('%s is for %s, but previous ELF files are ' \
+                    'for %s' % (path, s.arch, spec.arch))
+            for obj in s:
+                if spec.by_name(obj.name) is not None:
+                    raise Exception('object %s from %s clashes with an ' \
+                        'object from a previous ELF file' % (obj.name, path))
+                spec.add_object(obj, name)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return spec or Spec()
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Generate a single CapDL spec from many ELF files.')
+    parser.add_argument('elfs', metavar='ELF[=NAME]', nargs='+',
+        help='ELF file to include, optionally with the name to use for it. '
+             'The name defaults to the file name.')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+        help='Number of worker processes (default: one per CPU).')
+    parser.add_argument('-o', '--output', type=argparse.FileType('wb'),
+        default=sys.stdout, help='Output file (default: stdout).')
+    parser.add_argument('--binary', action='store_true',
+        help='Write the binary encoding rather than CapDL text.')
+    parser.add_argument('--no-tcb', dest='infer_tcb', action='store_false',
+        help='Do not infer a TCB for each ELF file.')
+    parser.add_argument('--no-asid', dest='infer_asid', action='store_false',
+        help='Do not infer an ASID pool for each ELF file.')
+    options = parser.parse_args(argv)
+
+    elfs = []
+    for arg in options.elfs:
+        path, _, name = arg.partition('=')
+        elfs.append((path, name or os.path.basename(path)))
+
+    spec = get_spec(elfs, options.infer_tcb, options.infer_asid,
+        options.jobs)
+    if options.binary:
+        Binary.save(spec, options.output)
+    else:
+        spec.write(options.output)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
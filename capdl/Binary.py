@@ -0,0 +1,468 @@
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+"""
+A compact binary encoding of a spec, for saving specs between runs without
+going through CapDL text.
+
+The file consists of fixed-size tables that refer to each other by index, so
+a saved spec can be memory mapped and individual objects decoded on demand.
+All values are little endian. The layout is:
+
+    header
+    objects      one record per object, in spec order
+    caps         one record per cap, grouped by containing object
+    tcbs         one record per TCB, holding the fields objects can't
+    init         the init arguments of all TCBs
+    names        object indices sorted by name, for binary search
+    string index offsets of the strings, plus a terminating offset
+    strings      the strings themselves
+
+Objects that are the referent of a cap but are not in the spec are stored
+too, marked as external, so caps can be restored faithfully. Labels are
+stored as strings.
+"""
+
+from Cap import Cap
+from Object import ASIDPool, AsyncEndpoint, CNode, Endpoint, Frame, \
+    IODevice, IOPageTable, IOPorts, IRQ, PageDirectory, PageTable, PDPT, \
+    PGD, PML4, PUD, TCB, Untyped, VCPU
+from Spec import Spec
+import mmap, struct
+
+MAGIC = 'CAPDLBIN'
+VERSION = 1
+
+# Object type codes. These are part of the format, so new types must be
+# given new codes rather than reusing old ones.
+TYPE_CODES = {
+    Untyped:1,
+    TCB:2,
+    Endpoint:3,
+    AsyncEndpoint:4,
+    CNode:5,
+    Frame:6,
+    PageTable:7,
+    PageDirectory:8,
+    ASIDPool:9,
+    IOPorts:10,
+    IODevice:11,
+    IOPageTable:12,
+    IRQ:13,
+    VCPU:14,
+    PDPT:15,
+    PML4:16,
+    PUD:17,
+    PGD:18,
+}
+CODE_TYPES = dict((v, k) for k, v in TYPE_CODES.items())
+
+# Object flags.
+OBJ_AUTO_SIZE = 1 # CNode with size_bits 'auto'
+OBJ_NONE = 2 # IRQ number or TCB domain is None
+OBJ_EXTERNAL = 4 # Referenced by a cap, but not in the spec
+
+# Cap flags.
+CAP_READ = 1
+CAP_WRITE = 2
+CAP_GRANT = 4
+CAP_UNCACHED = 8
+CAP_BADGE = 16
+CAP_PORTS = 32
+CAP_KEY_STR = 64
+CAP_KEY_NONE = 128
+
+# An absent string or object reference.
+NONE_INDEX = 0xffffffff
+
+_header = struct.Struct('<8sHH14I4x')
+_object = struct.Struct('<BBHIIIQQ')
+_cap = struct.Struct('<QIBBHIIII')
+_tcb = struct.Struct('<QQQIiIIi4x')
+_u32 = struct.Struct('<I')
+_i64 = struct.Struct('<q')
+
+def _align(n):
+    return (n + 7) & ~7
+
+class _Strings(object):
+    def __init__(self):
+        self.index = {}
+        self.strings = []
+
+    def add(self, s):
+        if s is None:
+            return NONE_INDEX
+        s = str(s)
+        i = self.index.get(s)
+        if i is None:
+            i = len(self.strings)
+            self.index[s] = i
+            self.strings.append(s)
+        return i
+
+def number_objects(spec):
+    """
+    The objects of a spec in the order they are encoded, followed by any that
+    are only reachable through caps, and a map from each to its index in
+    that order.
+    """
+    objs = list(spec)
+    index = dict((o, i) for i, o in enumerate(objs))
+    i = 0
+    while i < len(objs):
+        o = objs[i]
+        i += 1
+        if o.is_container():
+            for cap in o.slots.itervalues():
+                if cap is not None and cap.referent not in index:
+                    index[cap.referent] = len(objs)
+                    objs.append(cap.referent)
+    return objs, index
+
+def dumps(spec):
+    """
+    Encode a spec as a string of bytes.
+    """
+    assert isinstance(spec, Spec)
+
+    strings = _Strings()
+    arch = strings.add(spec.arch)
+
+    # Number every object before encoding anything that refers to them.
+    objs, index = number_objects(spec)
+
+    obj_records = []
+    cap_records = []
+    tcb_records = []
+    init = []
+    for i, o in enumerate(objs):
+        flags = 0
+        a = b = 0
+        t = type(o)
+        if t not in TYPE_CODES:
+            raise Exception('Cannot encode object %s of type %s' %
+                (o.name, t.__name__))
+        if o not in spec:
+            flags |= OBJ_EXTERNAL
+            label = NONE_INDEX
+        else:
+            label = strings.add(spec.label_of(o))
+        if isinstance(o, Frame):
+            a, b = o.size, o.paddr
+        elif isinstance(o, CNode):
+            if o.size_bits == 'auto':
+                flags |= OBJ_AUTO_SIZE
+            else:
+                a = o.size_bits
+        elif isinstance(o, Untyped):
+            a = o.size_bits
+        elif isinstance(o, IOPorts):
+            a = o.size
+        elif isinstance(o, IODevice):
+            a = o.domainID
+            b = (o.bus << 16) | (o.dev << 8) | o.fun
+        elif isinstance(o, IOPageTable):
+            a = o.level
+        elif isinstance(o, IRQ):
+            if o.number is None:
+                flags |= OBJ_NONE
+            else:
+                a = o.number
+        elif isinstance(o, TCB):
+            a = len(tcb_records)
+            if o.domain is None:
+                flags |= OBJ_NONE
+            tcb_records.append(_tcb.pack(o.addr, o.ip, o.sp,
+                strings.add(o.elf), o.prio, len(init), len(o.init),
+                o.domain or 0))
+            init.extend(o.init)
+        obj_records.append(_object.pack(TYPE_CODES[t], flags, 0,
+            strings.add(o.name), label, len(cap_records), a, b))
+
+        if not o.is_container():
+            continue
+        for key, cap in o.slots.items():
+            flags = 0
+            if key is None:
+                flags |= CAP_KEY_NONE
+                key = 0
+            elif isinstance(key, str):
+                flags |= CAP_KEY_STR
+                key = strings.add(key)
+            if cap is None:
+                cap_records.append(_cap.pack(key, NONE_INDEX, flags, 0, 0,
+                    0, 0, 0, 0))
+                continue
+            if cap.read:
+                flags |= CAP_READ
+            if cap.write:
+                flags |= CAP_WRITE
+            if cap.grant:
+                flags |= CAP_GRANT
+            if not cap.cached:
+                flags |= CAP_UNCACHED
+            badge = 0
+            if cap.badge is not None:
+                flags |= CAP_BADGE
+                badge = cap.badge
+            first = last = 0
+            if cap.ports:
+                flags |= CAP_PORTS
+                first, last = cap.ports[0], cap.ports[-1]
+            cap_records.append(_cap.pack(key, index[cap.referent], flags,
+                cap.guard_size, 0, cap.guard, badge, first, last))
+
+    names = sorted(xrange(len(objs)), key=lambda i: objs[i].name)
+
+    # Lay out the tables.
+    offset = _align(_header.size)
+    objects_off = offset
+    offset += _object.size * len(obj_records)
+    caps_off = offset
+    offset += _cap.size * len(cap_records)
+    tcbs_off = offset
+    offset += _tcb.size * len(tcb_records)
+    init_off = offset
+    offset += _i64.size * len(init)
+    names_off = offset
+    offset += _u32.size * len(names)
+    strings_off = offset
+
+    string_offsets = []
+    position = 0
+    for s in strings.strings:
+        string_offsets.append(position)
+        position += len(s)
+    string_offsets.append(position)
+    data_off = strings_off + _u32.size * len(string_offsets)
+
+    out = [_header.pack(MAGIC, VERSION, 0, arch, len(objs), len(spec),
+        len(cap_records), len(tcb_records), len(init), len(strings.strings),
+        objects_off, caps_off, tcbs_off, init_off, names_off, strings_off,
+        data_off)]
+    out.append('\0' * (objects_off - _header.size))
+    out.extend(obj_records)
+    out.extend(cap_records)
+    out.extend(tcb_records)
+    out.extend(_i64.pack(x) for x in init)
+    out.extend(_u32.pack(x) for x in names)
+    out.extend(_u32.pack(x) for x in string_offsets)
+    out.extend(strings.strings)
+    return ''.join(out)
+
+def save(spec, f):
+    """
+    Write the binary encoding of a spec to a path or writable stream.
+    """
+    data = dumps(spec)
+    if isinstance(f, str):
+        with open(f, 'wb') as stream:
+            stream.write(data)
+    else:
+        f.write(data)
+
+class SpecImage(object):
+    """
+    A binary encoded spec, decoded lazily. The constructor accepts a path, a
+    file object or a string of bytes; files are memory mapped rather than
+    read. Nothing is decoded until objects are asked for, and then only the
+    objects asked for and the objects reachable from them.
+    """
+    def __init__(self, source):
+        if isinstance(source, str) and not source.startswith(MAGIC):
+            f = open(source, 'rb')
+        else:
+            f = source
+        if isinstance(f, str):
+            self._data = f
+        else:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._data[:len(MAGIC)] != MAGIC:
+            raise Exception('Not a binary CapDL spec')
+        (_, version, _, arch, self._n_objects, self._n_spec_objects,
+            self._n_caps, _, _, _, self._objects_off, self._caps_off,
+            self._tcbs_off, self._init_off, self._names_off,
+            self._strings_off, self._data_off) = \
+            _header.unpack_from(self._data, 0)
+        if version != VERSION:
+            raise Exception('Unsupported binary CapDL version %d' % version)
+        self.arch = self._string(arch)
+
+        # Decoded objects, by index.
+        self._objs = {}
+        # Indices of containers whose caps have been decoded.
+        self._populated = set()
+
+    def _string(self, i):
+        if i == NONE_INDEX:
+            return None
+        start, end = struct.unpack_from('<II', self._data,
+            self._strings_off + _u32.size * i)
+        return self._data[self._data_off + start:self._data_off + end]
+
+    def _record(self, i):
+        return _object.unpack_from(self._data,
+            self._objects_off + _object.size * i)
+
+    def _object(self, i):
+        o = self._objs.get(i)
+        if o is not None:
+            return o
+        code, flags, _, name, _, _, a, b = self._record(i)
+        t = CODE_TYPES[code]
+        name = self._string(name)
+        if t is Frame:
+            o = Frame(name, a, b)
+        elif t is CNode:
+            o = CNode(name, 'auto' if flags & OBJ_AUTO_SIZE else a)
+        elif t is Untyped:
+            o = Untyped(name, a)
+        elif t is IOPorts:
+            o = IOPorts(name, a)
+        elif t is IODevice:
+            o = IODevice(name, a, b >> 16, (b >> 8) & 0xff, b & 0xff)
+        elif t is IOPageTable:
+            o = IOPageTable(name, a)
+        elif t is IRQ:
+            o = IRQ(name, None if flags & OBJ_NONE else a)
+        elif t is TCB:
+            addr, ip, sp, elf, prio, init_first, init_count, domain = \
+                _tcb.unpack_from(self._data, self._tcbs_off + _tcb.size * a)
+            init = [_i64.unpack_from(self._data,
+                        self._init_off + _i64.size * j)[0]
+                    for j in xrange(init_first, init_first + init_count)]
+            o = TCB(name, addr, ip, sp, self._string(elf), prio, init,
+                None if flags & OBJ_NONE else domain)
+        else:
+            o = t(name)
+        self._objs[i] = o
+        return o
+
+    def _populate(self, i):
+        """
+        Decode the caps of object i, returning the indices of the objects
+        they refer to.
+        """
+        self._populated.add(i)
+        o = self._objs[i]
+        if not o.is_container():
+            return []
+        first = self._record(i)[5]
+        if i + 1 < self._n_objects:
+            last = self._record(i + 1)[5]
+        else:
+            last = self._n_caps
+        referents = []
+        for j in xrange(first, last):
+            key, ref, flags, guard_size, _, guard, badge, port_first, \
+                port_last = _cap.unpack_from(self._data,
+                    self._caps_off + _cap.size * j)
+            if flags & CAP_KEY_NONE:
+                key = None
+            elif flags & CAP_KEY_STR:
+                key = self._string(key)
+            else:
+                key = int(key)
+            if ref == NONE_INDEX:
+                o[key] = None
+                continue
+            cap = Cap(self._object(ref), read=flags & CAP_READ != 0,
+                write=flags & CAP_WRITE != 0, grant=flags & CAP_GRANT != 0)
+            # Set the remaining fields directly; the setters' type checks
+            # were applied when the cap was constructed originally.
+            cap.guard = guard
+            cap.guard_size = guard_size
+            cap.cached = not flags & CAP_UNCACHED
+            if flags & CAP_BADGE:
+                cap.badge = badge
+            if flags & CAP_PORTS:
+                cap.ports = range(port_first, port_last + 1)
+            o[key] = cap
+            referents.append(ref)
+        return referents
+
+    def _materialise(self, i):
+        o = self._object(i)
+        pending = [i]
+        while pending:
+            j = pending.pop()
+            if j not in self._populated:
+                self._object(j)
+                pending.extend(self._populate(j))
+        return o
+
+    def index(self, name):
+        """
+        The index of the object with the given name, or None.
+        """
+        lo, hi = 0, self._n_objects
+        while lo < hi:
+            mid = (lo + hi) / 2
+            i = _u32.unpack_from(self._data,
+                self._names_off + _u32.size * mid)[0]
+            candidate = self._string(self._record(i)[3])
+            if candidate < name:
+                lo = mid + 1
+            elif candidate > name:
+                hi = mid
+            else:
+                return i
+        return None
+
+    def get(self, name):
+        """
+        Decode the object with the given name, together with every object
+        reachable from it through caps. Returns None if there is no such
+        object.
+        """
+        i = self.index(name)
+        if i is None:
+            return None
+        return self._materialise(i)
+
+    def names(self):
+        """
+        Iterate over the names of the objects in the spec.
+        """
+        for i in xrange(self._n_objects):
+            if not self._record(i)[1] & OBJ_EXTERNAL:
+                yield self._string(self._record(i)[3])
+
+    def to_spec(self):
+        """
+        Decode the whole spec.
+        """
+        spec = Spec(self.arch)
+        for i in xrange(self._n_objects):
+            record = self._record(i)
+            o = self._materialise(i)
+            if not record[1] & OBJ_EXTERNAL:
+                spec.add_object(o, self._string(record[4]))
+        return spec
+
+    def __len__(self):
+        return self._n_spec_objects
+
+    def __contains__(self, name):
+        return self.index(name) is not None
+
+def loads(data):
+    """
+    Decode a spec from a string of bytes.
+    """
+    return SpecImage(data).to_spec()
+
+def load(f):
+    """
+    Decode a spec from a path or file object.
+    """
+    return SpecImage(f).to_spec()
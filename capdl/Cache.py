@@ -0,0 +1,189 @@
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+"""
+An on-disk cache of the specs and page sets derived from ELF files, keyed on
+the content of the file. ELF files are only parsed on a cache miss.
+"""
+
+from ELF import ELF
+from PageCollection import PageCollection, READ, WRITE, EXECUTE
+import Binary
+import hashlib, os, struct, tempfile, time
+
+# Bump this when the way specs are derived from ELF files changes, to
+# invalidate existing entries.
+VERSION = 1
+
+# The kinds of entry, which are also the suffixes of their file names. Any
+# other file in the directory, such as an entry still being written, is left
+# alone.
+_KINDS = ('spec', 'pages')
+
+# Each entry starts with the time in seconds it took to create it, so we can
+# report how much time hits have saved.
+_entry_header = struct.Struct('<d')
+
+# Page set entries then hold the name and architecture, followed by the
+# extents as (base, limit, permissions) triples.
+_pages_header = struct.Struct('<II')
+_extent = struct.Struct('<QQQ')
+
+def _digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(1024 * 1024)
+            if not data:
+                break
+            h.update(data)
+    return h.hexdigest()
+
+class SpecCache(object):
+    """
+    A cache of ELF-derived specs and page sets in 'directory', which is
+    created if necessary. When the total size of the entries exceeds
+    'max_size' bytes, the least recently used are evicted. A directory may be
+    shared by several processes.
+    """
+    def __init__(self, directory, max_size=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.time_saved = 0.0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _entry(self, path, kind, *args):
+        key = hashlib.sha256(repr((VERSION, Binary.VERSION, _digest(path),
+            kind) + args)).hexdigest()
+        return os.path.join(self.directory, '%s.%s' % (key, kind))
+
+    def _read(self, entry):
+        try:
+            with open(entry, 'rb') as f:
+                data = f.read()
+        except IOError:
+            self.misses += 1
+            return None
+        try:
+            # Mark this entry as recently used.
+            os.utime(entry, None)
+        except OSError:
+            # Evicted by another process since we read it, which does not
+            # matter now.
+            pass
+        self.hits += 1
+        self.time_saved += _entry_header.unpack_from(data)[0]
+        return data[_entry_header.size:]
+
+    def _write(self, entry, data, elapsed):
+        # Write to a temporary file and rename it into place, so concurrent
+        # readers never see a partial entry.
+        fd, temp = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_entry_header.pack(elapsed))
+            f.write(data)
+        try:
+            os.rename(temp, entry)
+        except OSError:
+            # The entry is only an optimisation, so give up on it.
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+            return
+        self._evict(entry)
+
+    def _evict(self, keep):
+        '''
+        Evict the least recently used entries until the entries fit within
+        the size bound, other than 'keep', the entry just written.
+        '''
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if name.rsplit('.', 1)[-1] not in _KINDS:
+                continue
+            entry = os.path.join(self.directory, name)
+            try:
+                st = os.stat(entry)
+            except OSError:
+                # Removed by another process.
+                continue
+            total += st.st_size
+            if entry != keep:
+                entries.append((st.st_mtime, st.st_size, entry))
+        entries.sort()
+        while total > self.max_size and entries:
+            _, size, entry = entries.pop(0)
+            try:
+                os.remove(entry)
+                self.evictions += 1
+            except OSError:
+                pass
+            total -= size
+
+    def get_spec(self, path, name='', infer_tcb=True, infer_asid=True):
+        """
+        Equivalent to ELF(path, name).get_spec(infer_tcb, infer_asid).
+        """
+        entry = self._entry(path, 'spec', name, infer_tcb, infer_asid)
+        data = self._read(entry)
+        if data is not None:
+            return Binary.loads(data)
+
+        start = time.time()
+        spec = ELF(path, name).get_spec(infer_tcb, infer_asid)
+        self._write(entry, Binary.dumps(spec), time.time() - start)
+        return spec
+
+    def get_pages(self, path, name='', infer_asid=True):
+        """
+        Equivalent to ELF(path, name).get_pages(infer_asid).
+        """
+        entry = self._entry(path, 'pages', name, infer_asid)
+        data = self._read(entry)
+        if data is not None:
+            name_len, arch_len = _pages_header.unpack_from(data)
+            offset = _pages_header.size
+            pages_name = data[offset:offset + name_len]
+            offset += name_len
+            arch = data[offset:offset + arch_len]
+            offset += arch_len
+            pages = PageCollection(pages_name, arch, infer_asid)
+            for offset in xrange(offset, len(data), _extent.size):
+                base, limit, perm = _extent.unpack_from(data, offset)
+                pages.add_pages(base, limit, perm & READ != 0,
+                    perm & WRITE != 0, perm & EXECUTE != 0)
+            return pages
+
+        start = time.time()
+        pages = ELF(path, name).get_pages(infer_asid)
+        extents = ''.join(_extent.pack(base, limit, (READ if read else 0) |
+                (WRITE if write else 0) | (EXECUTE if execute else 0))
+            for base, limit, read, write, execute in pages.extents())
+        self._write(entry, _pages_header.pack(len(pages.name),
+            len(pages.arch)) + pages.name + pages.arch + extents,
+            time.time() - start)
+        return pages
+
+    def stats(self):
+        """
+        A summary of how the cache has performed in this process.
+        """
+        return {
+            'hits':self.hits,
+            'misses':self.misses,
+            'evictions':self.evictions,
+            'time_saved':self.time_saved,
+        }
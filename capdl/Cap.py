@@ -10,21 +10,93 @@
 
 import Object
 
+# Bits of a cap's flags. Caps are cached unless marked otherwise, so that the
+# common frame cap has the same flags as a fresh one.
+_READ = 1
+_WRITE = 2
+_GRANT = 4
+_UNCACHED = 8
+
+# The attributes of a cap other than its referent are held in an immutable
+# bundle of (flags, guard, guard_size, badge, ports). Caps with only flags set,
+# which are most of them, share one of a fixed set of bundles and cost little
+# more than the reference to their referent. Other bundles belong to a single
+# cap, so they are freed along with it. Setting an attribute replaces the
+# cap's bundle rather than modifying it.
+_FLAGS, _GUARD, _GUARD_SIZE, _BADGE, _PORTS = range(5)
+
+# The bundles of caps with only flags set, indexed by flags.
+_plain = [(flags, 0, 0, None, None) for flags in range(16)]
+
+def _bundle(attrs):
+    if attrs[1:] == _plain[0][1:]:
+        return _plain[attrs[_FLAGS]]
+    return attrs
+
+def _replace(cap, index, value):
+    attrs = list(cap._attrs)
+    attrs[index] = value
+    cap._attrs = _bundle(tuple(attrs))
+
+def _flag(bit, invert=False):
+    def get(self):
+        return bool(self._attrs[_FLAGS] & bit) != invert
+    def set(self, value):
+        flags = self._attrs[_FLAGS]
+        if bool(value) != invert:
+            flags |= bit
+        else:
+            flags &= ~bit
+        _replace(self, _FLAGS, flags)
+    return property(get, set)
+
+def _attribute(index):
+    def get(self):
+        return self._attrs[index]
+    def set(self, value):
+        _replace(self, index, value)
+    return property(get, set)
+
+def _get_ports(self):
+    # A new list each time, so modifying it does not change the cap. Use
+    # set_ports instead.
+    ports = self._attrs[_PORTS]
+    if ports is None:
+        return None
+    return list(ports)
+
+def _set_ports(self, ports):
+    # Bundles must be hashable.
+    _replace(self, _PORTS, None if ports is None else tuple(ports))
+
 class Cap(object):
     """
     A capability to a kernel object.
     """
+    __slots__ = ('referent', '_attrs')
+
     def __init__(self, referent, read=False, write=False, grant=False):
         assert isinstance(referent, Object.Object)
         self.referent = referent
-        self.read = read
-        self.write = write
-        self.grant = grant
-        self.guard = 0
-        self.guard_size = 0
-        self.badge = None
-        self.cached = True
-        self.ports = None
+        self._attrs = _plain[(_READ if read else 0) | \
+            (_WRITE if write else 0) | (_GRANT if grant else 0)]
+
+    read = _flag(_READ)
+    write = _flag(_WRITE)
+    grant = _flag(_GRANT)
+    cached = _flag(_UNCACHED, invert=True)
+
+    guard = _attribute(_GUARD)
+    guard_size = _attribute(_GUARD_SIZE)
+    badge = _attribute(_BADGE)
+    ports = property(_get_ports, _set_ports)
+
+    def __getstate__(self):
+        return self.referent, self._attrs
+
+    def __setstate__(self, state):
+        self.referent, attrs = state
+        self._attrs = _bundle(attrs)
 
     def set_guard(self, guard):
         assert isinstance(self.referent, Object.CNode)
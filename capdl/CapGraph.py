@@ -0,0 +1,285 @@
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+"""
+The capability graph of a spec as flat arrays of integers, for analysing
+the flow of authority without walking objects and caps.
+
+Objects are numbered as they are in the binary encoding of the spec (see
+Binary), so an object's number is also its index in a SpecImage of the same
+spec. The graph is held in compressed sparse row form:
+
+    types      the Binary type code of each object
+    offsets    for each object, the index of its first cap in the columns
+               below, followed by the total number of caps; the caps of
+               object i are offsets[i] up to offsets[i + 1]
+    targets    the number of the object each cap refers to
+    rights     the CAP_READ, CAP_WRITE and CAP_GRANT flags of each cap
+    badges     the badge of each cap, or NONE_INDEX if it has none
+
+Empty slots are left out. The columns are NumPy arrays if NumPy is available
+and arrays from the array module otherwise. Saved graphs hold the columns as
+they are in memory, little endian and aligned to eight bytes, after a
+header:
+
+    magic, version, padding        8 bytes, 2 bytes, 2 bytes
+    objects, caps                  4 bytes each
+    offsets of the five columns    8 bytes each
+"""
+
+from Binary import CAP_GRANT, CAP_READ, CAP_WRITE, NONE_INDEX, TYPE_CODES, \
+    number_objects
+from Object import TCB
+import array, mmap, struct, sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAGIC = 'CAPGRAPH'
+VERSION = 1
+
+_header = struct.Struct('<8sHHII5Q')
+
+# The columns, in the order they are saved, and the array module's type code
+# for each.
+_COLUMNS = [
+    ('types', 'B'),
+    ('offsets', 'I'),
+    ('targets', 'I'),
+    ('rights', 'B'),
+    ('badges', 'I'),
+]
+
+def _align(n):
+    return (n + 7) & ~7
+
+class CapGraph(object):
+    """
+    The capability graph of a spec. See the top of this file for the meaning
+    of the columns. 'objects' is the list of objects by number, if the graph
+    was built from a spec rather than loaded.
+    """
+    def __init__(self, types, offsets, targets, rights, badges, objects=None):
+        self.types = types
+        self.offsets = offsets
+        self.targets = targets
+        self.rights = rights
+        self.badges = badges
+        self.objects = objects
+        self._index = None
+        # The graph with every cap reversed, built when first needed.
+        self._reversed = None
+
+    def index(self, obj):
+        """
+        The number of an object in a graph built from a spec.
+        """
+        assert self.objects is not None, 'loaded graphs have no objects'
+        if self._index is None:
+            self._index = dict((o, i) for i, o in enumerate(self.objects))
+        return self._index[obj]
+
+    def holders(self, target, rights=0):
+        """
+        The numbers of the objects holding a cap to the object numbered
+        'target' with at least the given rights, in order.
+        """
+        if numpy is not None:
+            edges = numpy.flatnonzero((self.targets == target) &
+                (self.rights & rights == rights))
+            found = numpy.searchsorted(self.offsets, edges, 'right') - 1
+            return numpy.unique(found).tolist()
+        found = []
+        offsets = self.offsets
+        for i in xrange(len(self.types)):
+            for e in xrange(offsets[i], offsets[i + 1]):
+                if self.targets[e] == target and \
+                        self.rights[e] & rights == rights:
+                    found.append(i)
+                    break
+        return found
+
+    def reachable(self, roots, reverse=False):
+        """
+        The numbers of the objects reachable through caps from any of the
+        objects numbered in 'roots', including the roots themselves, in
+        order. With 'reverse', the objects from which any of the roots can
+        be reached instead.
+        """
+        offsets, targets = self.offsets, self.targets
+        if reverse:
+            if self._reversed is None:
+                self._reversed = self._reverse()
+            offsets, targets = self._reversed
+        if numpy is not None:
+            return _reach(offsets, targets, len(self.types), roots)
+        seen = set(roots)
+        pending = list(seen)
+        while pending:
+            i = pending.pop()
+            for e in xrange(offsets[i], offsets[i + 1]):
+                if targets[e] not in seen:
+                    seen.add(targets[e])
+                    pending.append(targets[e])
+        return sorted(seen)
+
+    def _reverse(self):
+        n = len(self.types)
+        if numpy is not None:
+            counts = numpy.diff(self.offsets.astype(numpy.int64))
+            sources = numpy.repeat(numpy.arange(n, dtype=numpy.uint32),
+                counts)
+            order = numpy.argsort(self.targets, kind='mergesort')
+            offsets = numpy.zeros(n + 1, numpy.int64)
+            numpy.cumsum(numpy.bincount(self.targets, minlength=n),
+                out=offsets[1:])
+            return offsets, sources[order]
+        sources = [[] for _ in xrange(n)]
+        for i in xrange(n):
+            for e in xrange(self.offsets[i], self.offsets[i + 1]):
+                sources[self.targets[e]].append(i)
+        offsets = [0]
+        for s in sources:
+            offsets.append(offsets[-1] + len(s))
+        return offsets, [i for s in sources for i in s]
+
+    def senders(self, target):
+        """
+        The numbers of the TCBs that can send to the endpoint numbered
+        'target': those from which a cap to it with write rights can be
+        reached through caps.
+        """
+        holders = self.holders(target, CAP_WRITE)
+        tcb = TYPE_CODES[TCB]
+        return [i for i in self.reachable(holders, reverse=True)
+            if self.types[i] == tcb]
+
+def _reach(offsets, targets, n, roots):
+    # Visit the graph breadth first, a whole frontier at a time.
+    seen = numpy.zeros(n, bool)
+    frontier = numpy.unique(numpy.asarray(roots, numpy.int64))
+    seen[frontier] = True
+    while frontier.size:
+        starts = offsets[frontier].astype(numpy.int64)
+        counts = offsets[frontier + 1] - starts
+        total = int(counts.sum())
+        if not total:
+            break
+        # The indices of every cap of every object in the frontier.
+        edges = numpy.repeat(starts - (numpy.cumsum(counts) - counts),
+            counts) + numpy.arange(total)
+        found = targets[edges]
+        frontier = numpy.unique(found[~seen[found]])
+        seen[frontier] = True
+    return numpy.flatnonzero(seen).tolist()
+
+def build(spec):
+    """
+    The capability graph of a spec.
+    """
+    objs, index = number_objects(spec)
+    types = array.array('B')
+    offsets = array.array('I')
+    targets = array.array('I')
+    rights = array.array('B')
+    badges = array.array('I')
+    for o in objs:
+        t = type(o)
+        if t not in TYPE_CODES:
+            raise Exception('Cannot encode object %s of type %s' %
+                (o.name, t.__name__))
+        types.append(TYPE_CODES[t])
+        offsets.append(len(targets))
+        if not o.is_container():
+            continue
+        for cap in o.slots.itervalues():
+            if cap is None:
+                continue
+            targets.append(index[cap.referent])
+            rights.append((CAP_READ if cap.read else 0) |
+                (CAP_WRITE if cap.write else 0) |
+                (CAP_GRANT if cap.grant else 0))
+            badges.append(NONE_INDEX if cap.badge is None else cap.badge)
+    offsets.append(len(targets))
+    if numpy is not None:
+        types, offsets, targets, rights, badges = [_as_numpy(c)
+            for c in (types, offsets, targets, rights, badges)]
+    return CapGraph(types, offsets, targets, rights, badges, objs)
+
+def _as_numpy(column):
+    # A view of an array as a NumPy array.
+    dtype = numpy.dtype(column.typecode)
+    if not len(column):
+        return numpy.zeros(0, dtype)
+    return numpy.frombuffer(column, dtype)
+
+def _bytes(column, code):
+    if numpy is not None and isinstance(column, numpy.ndarray):
+        return column.astype(numpy.dtype(code).newbyteorder('<')).tostring()
+    if sys.byteorder != 'little':
+        column = array.array(code, column)
+        column.byteswap()
+    return column.tostring()
+
+def save(graph, f):
+    """
+    Write a capability graph to a path or writable stream.
+    """
+    data = [_bytes(getattr(graph, name), code) for name, code in _COLUMNS]
+    offsets = []
+    offset = _align(_header.size)
+    for d in data:
+        offsets.append(offset)
+        offset = _align(offset + len(d))
+    out = [_header.pack(MAGIC, VERSION, 0, len(graph.types),
+        len(graph.targets), *offsets)]
+    position = _header.size
+    for d, offset in zip(data, offsets):
+        out.append('\0' * (offset - position))
+        out.append(d)
+        position = offset + len(d)
+    if isinstance(f, str):
+        with open(f, 'wb') as stream:
+            stream.write(''.join(out))
+    else:
+        f.write(''.join(out))
+
+def load(f):
+    """
+    Read a capability graph from a path or file object. The file is memory
+    mapped and, if NumPy is available, the columns are views of it rather
+    than copies.
+    """
+    if isinstance(f, str):
+        f = open(f, 'rb')
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if data[:len(MAGIC)] != MAGIC:
+        raise Exception('Not a CapDL capability graph')
+    (_, version, _, n_objects, n_caps, types_off, offsets_off, targets_off,
+        rights_off, badges_off) = _header.unpack_from(data, 0)
+    if version != VERSION:
+        raise Exception('Unsupported capability graph version %d' % version)
+    return CapGraph(_read(data, 'B', types_off, n_objects),
+        _read(data, 'I', offsets_off, n_objects + 1),
+        _read(data, 'I', targets_off, n_caps),
+        _read(data, 'B', rights_off, n_caps),
+        _read(data, 'I', badges_off, n_caps))
+
+def _read(data, code, offset, count):
+    if numpy is not None:
+        return numpy.frombuffer(data, numpy.dtype(code).newbyteorder('<'),
+            count, offset)
+    column = array.array(code)
+    column.fromstring(data[offset:offset + count * column.itemsize])
+    if sys.byteorder != 'little':
+        column.byteswap()
+    return column
@@ -0,0 +1,103 @@
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+"""
+Sharing identical read-only frames between address spaces. Frame contents
+are only known for frames generated from memory mapped ELF files (see
+ELF's use_mmap), so other frames are left alone.
+"""
+
+from Object import Frame
+import collections, hashlib
+
+_ZEROS = '\0' * (64 * 1024)
+
+def _update_zeros(h, length):
+    while length > 0:
+        h.update(_ZEROS[:min(length, len(_ZEROS))])
+        length -= len(_ZEROS)
+
+def _digest(frame):
+    '''
+    A digest of the initial contents of a frame, computed from its fill
+    without materialising the contents.
+    '''
+    h = hashlib.sha1()
+    position = 0
+    for fill in frame.fill:
+        _update_zeros(h, fill.dest_offset - position)
+        h.update(fill.data())
+        position = fill.dest_offset + fill.length
+    _update_zeros(h, frame.size - position)
+    return frame.size, h.digest()
+
+class DedupReport(object):
+    '''
+    The outcome of deduplicate_frames.
+    '''
+    def __init__(self):
+        # Frames whose contents were known and that were only mapped
+        # read-only.
+        self.frames_examined = 0
+        self.frames_saved = 0
+        self.bytes_saved = 0
+
+    def __repr__(self):
+        return 'examined %d frames, saved %d frames (%d bytes)' % \
+            (self.frames_examined, self.frames_saved, self.bytes_saved)
+
+def deduplicate_frames(specs):
+    '''
+    Find frames in the given specs with identical initial contents that are
+    never writable through any cap, and replace them with a single shared
+    frame. Every cap to a duplicate, whether it maps the frame or is held in
+    a CSpace or TCB, is redirected to the shared frame, which is added to
+    every spec that held the duplicate or a cap to it, and the duplicates
+    are removed. Page tables are not shared, so each address space keeps its
+    own mappings. Device frames are never shared. Returns a DedupReport.
+    '''
+    # Find every cap to every frame. The first frame seen with given
+    # contents is the one kept, so keep them in order.
+    mappings = collections.OrderedDict()
+    owners = {}
+    for spec in specs:
+        for frame in spec.of_type(Frame):
+            mappings.setdefault(frame, [])
+            owners.setdefault(frame, set()).add(spec)
+        for container in spec.containers():
+            for cap in container.slots.itervalues():
+                if cap is not None and isinstance(cap.referent, Frame):
+                    mappings.setdefault(cap.referent, []).append(cap)
+                    owners.setdefault(cap.referent, set()).add(spec)
+
+    report = DedupReport()
+    shared = {}
+    for frame, caps in mappings.items():
+        if frame.fill is None or frame.paddr != 0 or \
+           any(cap.write for cap in caps):
+            continue
+        report.frames_examined += 1
+        key = _digest(frame)
+        canonical = shared.setdefault(key, frame)
+        if canonical is frame:
+            continue
+
+        for cap in caps:
+            cap.referent = canonical
+        for spec in owners[frame]:
+            label = None
+            if frame in spec:
+                label = spec.label_of(frame)
+                spec.remove_object(frame)
+            spec.add_object(canonical, label)
+        report.frames_saved += 1
+        report.bytes_saved += frame.size
+
+    return report
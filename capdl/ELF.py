@@ -16,42 +16,103 @@ without elftools installed by not importing this particular file.
 from elftools.elf.elffile import ELFFile
 from elftools.elf.constants import P_FLAGS
 from Object import TCB
-from util import PAGE_SIZE, round_down
+from util import round_down
 from PageCollection import PageCollection
-import re
+from bisect import bisect_left, bisect_right
+import mmap, re
+
+class NoSymbolTable(Exception):
+    """
+    Raised on symbol lookups in an ELF file that has been stripped.
+    """
+    pass
+
+class _SymbolsByAddress(object):
+    """
+    Symbols sorted by address, given as (start, size, name) triples. Symbols
+    with no size cover only their own address.
+    """
+    def __init__(self, syms):
+        self._syms = sorted(syms)
+        self._addresses = [x[0] for x in self._syms]
+        # The end of the furthest reaching symbol among each symbol and those
+        # before it, so a search for a covering symbol knows when to stop.
+        self._reach = []
+        reach = 0
+        for start, size, _ in self._syms:
+            reach = max(reach, start + max(size, 1))
+            self._reach.append(reach)
+
+    def at(self, vaddr):
+        """
+        The name of the symbol covering 'vaddr', or None. Where several do,
+        the one starting closest below it wins.
+        """
+        i = bisect_right(self._addresses, vaddr) - 1
+        while i >= 0 and self._reach[i] > vaddr:
+            start, size, name = self._syms[i]
+            if vaddr < start + max(size, 1):
+                return name
+            i -= 1
+        return None
+
+    def between(self, start, end):
+        """
+        The names of the symbols starting in [start, end), in address order.
+        """
+        lo = bisect_left(self._addresses, start)
+        hi = bisect_left(self._addresses, end)
+        return [x[2] for x in self._syms[lo:hi]]
 
 class ELF(object):
-    def __init__(self, elf, name=''):
+    def __init__(self, elf, name='', use_mmap=False):
         """
         This constructor is overloaded and can accept either a string as the
         parameter 'elf', or a stream to ELF data. 'name' is only used when
-        generating CapDL from the ELF file.
+        generating CapDL from the ELF file. If 'use_mmap' is set, the file is
+        memory mapped and the frames generated from it describe their initial
+        contents as views of the mapping; the stream must then be a real
+        file.
         """
         if isinstance(elf, str):
             f = open(elf, 'rb')
         else:
             f = elf
+        if use_mmap:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            f = self._data
+        else:
+            self._data = None
         self._elf = ELFFile(f)
         self.name = name
         self.symtab = {}
+        self._symbols_indexed = False
+        # Sorted views of the symbol table, built on first use.
+        self._names = None
+        self._by_address = None
 
     def get_entry_point(self):
         return self._elf['e_entry']
 
-    def _get_symbol(self, symbol):
-        if symbol in self.symtab:
-            return self.symtab[symbol]
-
+    def _index_symbols(self):
+        """
+        Read the whole symbol table in a single pass. Where a name is defined
+        more than once, the first definition wins.
+        """
+        if self._symbols_indexed:
+            return
         table = self._elf.get_section_by_name('.symtab')
         if not table:
             # This ELF file has been stripped.
-            raise Exception('No symbol table available')
-
+            raise NoSymbolTable('No symbol table available')
         for s in table.iter_symbols():
-            self.symtab[s.name] = s
-            if s.name == symbol:
-                return s
-        return None
+            if s.name and s.name not in self.symtab:
+                self.symtab[s.name] = s
+        self._symbols_indexed = True
+
+    def _get_symbol(self, symbol):
+        self._index_symbols()
+        return self.symtab.get(symbol)
 
     def get_symbol_vaddr(self, symbol):
         sym = self._get_symbol(symbol)
@@ -65,6 +126,58 @@ class ELF(object):
             return sym['st_size']
         return None
 
+    def get_symbols(self, symbols):
+        """
+        Look up many symbols at once. Returns a dictionary mapping each
+        symbol to its virtual address, or None if it is not present.
+        """
+        self._index_symbols()
+        result = {}
+        for symbol in symbols:
+            sym = self.symtab.get(symbol)
+            result[symbol] = sym['st_value'] if sym else None
+        return result
+
+    def get_symbols_with_prefix(self, prefix):
+        """
+        The names of all symbols starting with 'prefix', in sorted order.
+        """
+        self._index_symbols()
+        if self._names is None:
+            self._names = sorted(self.symtab)
+        start = bisect_left(self._names, prefix)
+        end = start
+        while end < len(self._names) and self._names[end].startswith(prefix):
+            end += 1
+        return self._names[start:end]
+
+    def _index_addresses(self):
+        self._index_symbols()
+        if self._by_address is not None:
+            return
+        # Section and file symbols don't describe a location in the image.
+        syms = [(s['st_value'], s['st_size'], name)
+            for name, s in self.symtab.items()
+            if s['st_info']['type'] not in ['STT_SECTION', 'STT_FILE']]
+        self._by_address = _SymbolsByAddress(syms)
+
+    def symbol_at(self, vaddr):
+        """
+        The name of the symbol covering the virtual address 'vaddr', or None
+        if there is no such symbol. Symbols with no size cover only their own
+        address.
+        """
+        self._index_addresses()
+        return self._by_address.at(vaddr)
+
+    def get_symbols_in(self, start, end):
+        """
+        The names of all symbols whose address is in [start, end), in address
+        order.
+        """
+        self._index_addresses()
+        return self._by_address.between(start, end)
+
     def _safe_name(self):
         """
         Replace characters that the CapDL tools parse differently.
@@ -76,10 +189,10 @@ class ELF(object):
 
     def get_pages(self, infer_asid=True, pd=None):
         """
-        Returns a dictionary of pages keyed on base virtual address, that are
-        required to ELF load this file. Each dictionary entry is a dictionary
-        containing booleans 'read', 'write' and 'execute' for the permissions
-        of the page.
+        Returns a collection of pages keyed on base virtual address, that are
+        required to ELF load this file. Each entry is a dictionary containing
+        booleans 'read', 'write' and 'execute' for the permissions of the
+        page.
         """
         pages = PageCollection(self._safe_name(), self.get_arch(), infer_asid, pd)
         for seg in self._elf.iter_segments():
@@ -91,9 +204,12 @@ class ELF(object):
             r = (seg['p_flags'] & P_FLAGS.PF_R) > 0
             w = (seg['p_flags'] & P_FLAGS.PF_W) > 0
             x = (seg['p_flags'] & P_FLAGS.PF_X) > 0
-            map(lambda y: pages.add_page(y, r, w, x),
-                xrange(vaddr, int(seg['p_vaddr']) + int(seg['p_memsz']),
-                    PAGE_SIZE))
+            pages.add_pages(vaddr, int(seg['p_vaddr']) + int(seg['p_memsz']),
+                r, w, x)
+            if self._data is not None:
+                # The rest of the segment, up to p_memsz, is zero filled.
+                pages.add_fill(int(seg['p_vaddr']), self._data,
+                    int(seg['p_offset']), int(seg['p_filesz']))
         return pages
 
     def get_spec(self, infer_tcb=True, infer_asid=True, pd=None):
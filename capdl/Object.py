@@ -12,32 +12,43 @@
 Definitions of kernel objects.
 """
 
+from util import SlotMap, set_slot_state, slot_state
 import Cap
-import math
 
 class Object(object):
     """
     Parent of all kernel objects. This class is not expected to be instantiated.
     """
+    __slots__ = ('name',)
+
     def __init__(self, name):
         self.name = name
 
     def is_container(self):
         return False
 
+    __getstate__ = slot_state
+    __setstate__ = set_slot_state
+
 class ContainerObject(Object):
     """
     Common functionality for all objects that are cap containers, in the sense
     that they may have child caps.
     """
+    __slots__ = ('slots',)
+
     def __init__(self, name):
         super(ContainerObject, self).__init__(name)
-        self.slots = {}
+        self.slots = SlotMap()
 
     def is_container(self):
         return True
 
-    def print_contents(self):
+    def iter_contents(self):
+        """
+        Generate the lines of this object's entry in the caps section one at
+        a time.
+        """
         def slot_index(index):
             """
             Print a slot index in a sensible way.
@@ -50,10 +61,18 @@ class ContainerObject(Object):
                 assert isinstance(index, str)
                 return '%s: ' % index
 
-        return '%s {\n%s\n}' % \
-            (self.name, \
-             '\n'.join(map(lambda x: '%s%s' % (slot_index(x[0]), x[1]), \
-                  filter(lambda y: y[1] is not None, self.slots.items()))))
+        yield '%s {' % self.name
+        empty = True
+        for index, cap in self.slots.iteritems():
+            if cap is not None:
+                empty = False
+                yield '%s%s' % (slot_index(index), cap)
+        if empty:
+            yield ''
+        yield '}'
+
+    def print_contents(self):
+        return '\n'.join(self.iter_contents())
 
     def __contains__(self, key):
         return key in self.slots
@@ -70,11 +89,40 @@ class ContainerObject(Object):
     def __iter__(self):
         return self.slots.__iter__()
 
+class FrameFill(object):
+    """
+    Part of the initial contents of a frame: 'length' bytes at 'offset' in
+    'source', such as a memory mapped file, copied to 'dest_offset' in the
+    frame.
+    """
+    __slots__ = ('dest_offset', 'source', 'offset', 'length')
+
+    def __init__(self, dest_offset, source, offset, length):
+        self.dest_offset = dest_offset
+        self.source = source
+        self.offset = offset
+        self.length = length
+
+    __getstate__ = slot_state
+    __setstate__ = set_slot_state
+
+    def data(self):
+        """
+        The bytes of this fill, as a view of the source rather than a copy.
+        """
+        return buffer(self.source, self.offset, self.length)
+
 class Frame(Object):
-    def __init__(self, name, size=4096, paddr=0):
+    __slots__ = ('size', 'paddr', 'fill')
+
+    def __init__(self, name, size=4096, paddr=0, fill=None):
         super(Frame, self).__init__(name)
         self.size = size
         self.paddr = paddr
+        # The initial contents of the frame, as a list of FrameFills in order
+        # of destination offset. Bytes not covered by a fill are zero. None
+        # if the contents are unknown.
+        self.fill = fill
 
     def __repr__(self):
         # Hex does not produce porcelain output across architectures due to
@@ -83,28 +131,65 @@ class Frame(Object):
         # we have asked for a hex value
         def reliable_hex(val) :
             return hex(val).rstrip('L')
+        # Sizes are given in kilobytes, or megabytes for sections and larger.
+        if self.size % (1024 * 1024) == 0:
+            size = '%dM' % (self.size / (1024 * 1024))
+        else:
+            size = '%dk' % (self.size / 1024)
         return '%(name)s = frame (%(size)s%(maybepaddr)s)' % {
             'name':self.name,
-            'size':'4k' if self.size == 4096 else str(self.size) + 'k',
+            'size':size,
             'maybepaddr':(', paddr: %s' % reliable_hex(self.paddr)) if self.paddr != 0 else '',
         }
 
 class PageTable(ContainerObject):
+    __slots__ = ()
+
     def __repr__(self):
         return '%s = pt' % self.name
 
 class PageDirectory(ContainerObject):
+    __slots__ = ()
+
     def __repr__(self):
         return '%s = pd' % self.name
 
+class PDPT(ContainerObject):
+    __slots__ = ()
+
+    def __repr__(self):
+        return '%s = pdpt' % self.name
+
+class PML4(ContainerObject):
+    __slots__ = ()
+
+    def __repr__(self):
+        return '%s = pml4' % self.name
+
+class PUD(ContainerObject):
+    __slots__ = ()
+
+    def __repr__(self):
+        return '%s = pud' % self.name
+
+class PGD(ContainerObject):
+    __slots__ = ()
+
+    def __repr__(self):
+        return '%s = pgd' % self.name
+
 class ASIDPool(ContainerObject):
+    __slots__ = ()
+
     def __repr__(self):
         return '%s = asid_pool' % self.name
 
 def calculate_size(cnode):
-    return int(math.floor(math.log(reduce(max, cnode.slots.keys(), 4), 2)) + 1)
+    return max(cnode.slots.max_slot(), 4).bit_length()
 
 class CNode(ContainerObject):
+    __slots__ = ('size_bits',)
+
     def __init__(self, name, size_bits='auto'):
         super(CNode, self).__init__(name)
         self.size_bits = size_bits
@@ -115,6 +200,23 @@ class CNode(ContainerObject):
             # checked.
             self.size_bits = calculate_size(self)
 
+    def usage(self):
+        """
+        How much of this CNode is in use: the number of occupied slots, one
+        more than the largest occupied slot, the number of unoccupied slots,
+        and the smallest size it could be.
+        """
+        size_bits = self.size_bits
+        if size_bits == 'auto':
+            size_bits = calculate_size(self)
+        occupied = len(self.slots)
+        return {
+            'occupied':occupied,
+            'high_water':self.slots.max_slot() + 1,
+            'wasted':(1 << size_bits) - occupied,
+            'min_size_bits':calculate_size(self),
+        }
+
     def __repr__(self):
         if self.size_bits == 'auto':
             size_bits = calculate_size(self)
@@ -123,14 +225,20 @@ class CNode(ContainerObject):
         return '%s = cnode (%s bits)' % (self.name, size_bits)
 
 class Endpoint(Object):
+    __slots__ = ()
+
     def __repr__(self):
         return '%s = ep' % self.name
 
 class AsyncEndpoint(Object):
+    __slots__ = ()
+
     def __repr__(self):
         return '%s = aep' % self.name
 
 class TCB(ContainerObject):
+    __slots__ = ('addr', 'ip', 'sp', 'elf', 'prio', 'init', 'domain')
+
     def __init__(self, name, ipc_buffer_vaddr=0x0, ip=0x0, sp=0x0, elf=None, \
             prio=254, init=None, domain=None):
         super(TCB, self).__init__(name)
@@ -144,21 +252,33 @@ class TCB(ContainerObject):
 
     def __repr__(self):
         # XXX: Assumes 32-bit pointers
-        s = '%(name)s = tcb (addr: 0x%(addr)0.8x, ip: 0x%(ip)0.8x, sp: 0x%(sp)0.8x, elf: %(elf)s, prio: %(prio)s, init: %(init)s' % self.__dict__
+        s = '%(name)s = tcb (addr: 0x%(addr)0.8x, ip: 0x%(ip)0.8x, sp: 0x%(sp)0.8x, elf: %(elf)s, prio: %(prio)s, init: %(init)s' % {
+            'name':self.name,
+            'addr':self.addr,
+            'ip':self.ip,
+            'sp':self.sp,
+            'elf':self.elf,
+            'prio':self.prio,
+            'init':self.init,
+        }
         if self.domain is not None:
             s += ', dom: %d' % self.domain
         s += ')'
         return s
 
 class Untyped(Object):
+    __slots__ = ('size_bits',)
+
     def __init__(self, name, size_bits=12):
         super(Untyped, self).__init__(name)
         self.size_bits = size_bits
 
     def __repr__(self):
-        return '%(name)s = ut (%(size_bits)s bits)' % self.__dict__
+        return '%s = ut (%s bits)' % (self.name, self.size_bits)
 
 class IOPorts(Object):
+    __slots__ = ('size',)
+
     def __init__(self, name, size=65536): # 64k size is the default in CapDL spec.
         super(IOPorts, self).__init__(name)
         self.size = size
@@ -169,6 +289,8 @@ class IOPorts(Object):
              'size':self.size / 1024}
 
 class IODevice(Object):
+    __slots__ = ('domainID', 'bus', 'dev', 'fun')
+
     def __init__(self, name, domainID, bus, dev, fun):
         super(IODevice, self).__init__(name)
         self.domainID = domainID
@@ -180,17 +302,21 @@ class IODevice(Object):
         return '%s = io_device (domainID: %d, 0x%x:%d.%d)' % (self.name, self.domainID, self.bus, self.dev, self.fun)
 
 class IOPageTable(ContainerObject):
+    __slots__ = ('level',)
+
     def __init__(self, name, level=1):
         super(IOPageTable, self).__init__(name)
         assert level in [1, 2, 3] # Complies with CapDL spec
         self.level = level
 
     def __repr__(self):
-        return '%(name)s = io_pt (level: %(level)s)' % self.__dict__
+        return '%s = io_pt (level: %s)' % (self.name, self.level)
 
 class IRQ(ContainerObject):
     # In the implementation there is no such thing as an IRQ object, but it is
     # simpler to model it here as an actual object.
+    __slots__ = ('number',)
+
     def __init__(self, name, number=None):
         super(IRQ, self).__init__(name)
         self.number = number
@@ -211,5 +337,7 @@ class IRQ(ContainerObject):
         return '%s = irq' % self.name
 
 class VCPU(Object):
+    __slots__ = ()
+
     def __repr__(self):
         return '%s = vcpu' % self.name
@@ -9,90 +9,399 @@
 #
 
 '''
-Wrapper around a dict of pages for some extra functionality. Only intended to
+Wrapper around a set of pages for some extra functionality. Only intended to
 be used internally.
 '''
 
+from Arch import get_arch
 from Cap import Cap
-from Object import ASIDPool, PageDirectory, Frame, PageTable
+from Object import ASIDPool, PageDirectory, Frame, FrameFill, PageTable, \
+    PDPT, PGD, PML4, PUD
 from Spec import Spec
-from util import page_table_vaddr, page_table_index, page_index, round_down, \
-    PAGE_SIZE
-import collections
-from weakref import ref
-
-def consume(iterator):
-    '''Take a generator and exhaust it. Useful for discarding the unused result
-    of something that would otherwise accumulate in memory. Clagged from
-    https://docs.python.org/2/library/itertools.html'''
-    # feed the entire iterator into a zero-length deque
-    collections.deque(iterator, maxlen=0)
+from util import round_down, round_up, PAGE_SIZE
+from bisect import bisect_left, bisect_right, insort
+import itertools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# The types of paging structure, by their CapDL names.
+_TABLE_TYPES = {
+    'pt':PageTable,
+    'pd':PageDirectory,
+    'pdpt':PDPT,
+    'pml4':PML4,
+    'pud':PUD,
+    'pgd':PGD,
+}
+
+# Permission bits of an extent.
+READ = 1
+WRITE = 2
+EXECUTE = 4
+
+def _perm_bits(read, write, execute):
+    return (READ if read else 0) | (WRITE if write else 0) | \
+        (EXECUTE if execute else 0)
+
+class _Page(dict):
+    '''
+    The permissions of a page of a PageCollection, as a dictionary. Changing
+    a permission changes the page in the collection.
+    '''
+    def __init__(self, pages, vaddr, perm):
+        super(_Page, self).__init__(read=perm & READ != 0,
+            write=perm & WRITE != 0, execute=perm & EXECUTE != 0)
+        self._pages = pages
+        self._vaddr = vaddr
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            raise KeyError(key)
+        super(_Page, self).__setitem__(key, bool(value))
+        self._pages._set_page(self._vaddr, _perm_bits(self['read'],
+            self['write'], self['execute']))
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __delitem__(self, key):
+        raise TypeError('page permissions cannot be removed')
+
+class _Extents(object):
+    '''
+    A sorted set of non-overlapping, page-aligned extents [base, limit), each
+    carrying permission bits. Adjacent extents with identical permissions are
+    always coalesced, so a contiguous region with uniform permissions is
+    represented by a single extent however it was constructed.
+    '''
+    def __init__(self):
+        # Parallel lists, rather than a list of tuples, so we can bisect on
+        # them directly.
+        self._bases = []
+        self._limits = []
+        self._perms = []
+
+    def add(self, base, limit, perm, replace=False):
+        '''
+        Add the range [base, limit), upgrading the permissions of any part of
+        it that is already present, or with 'replace', setting them.
+        '''
+        if base >= limit:
+            return
+        bases, limits, perms = self._bases, self._limits, self._perms
+
+        # The extents [lo, hi) are those that overlap or touch the new range.
+        lo = bisect_left(limits, base)
+        hi = bisect_right(bases, limit)
+
+        # Split the affected region into pieces of uniform permissions.
+        pieces = []
+        cursor = base
+        for i in xrange(lo, hi):
+            b, l, p = bases[i], limits[i], perms[i]
+            if b < base:
+                pieces.append((b, base, p))
+            if cursor < b:
+                pieces.append((cursor, b, perm))
+            overlap_base = max(b, base)
+            overlap_limit = min(l, limit)
+            if overlap_base < overlap_limit:
+                pieces.append((overlap_base, overlap_limit,
+                    perm if replace else p | perm))
+            if l > limit:
+                pieces.append((limit, l, p))
+            cursor = max(cursor, l)
+        if cursor < limit:
+            pieces.append((cursor, limit, perm))
+
+        # Coalesce neighbouring pieces with the same permissions.
+        new_bases, new_limits, new_perms = [], [], []
+        for b, l, p in pieces:
+            if new_perms and new_perms[-1] == p and new_limits[-1] == b:
+                new_limits[-1] = l
+            else:
+                new_bases.append(b)
+                new_limits.append(l)
+                new_perms.append(p)
+
+        bases[lo:hi] = new_bases
+        limits[lo:hi] = new_limits
+        perms[lo:hi] = new_perms
+
+    def lookup(self, vaddr):
+        '''
+        The permissions of the page containing vaddr, or None if that page is
+        not present.
+        '''
+        i = bisect_right(self._bases, vaddr) - 1
+        if i >= 0 and vaddr < self._limits[i]:
+            return self._perms[i]
+        return None
+
+    def overlapping(self, base, limit):
+        '''
+        Iterate over the parts of the extents within [base, limit) as
+        (base, limit, perm) tuples in address order.
+        '''
+        i = bisect_right(self._limits, base)
+        while i < len(self._bases) and self._bases[i] < limit:
+            yield max(self._bases[i], base), min(self._limits[i], limit), \
+                self._perms[i]
+            i += 1
+
+    def __iter__(self):
+        '''
+        Iterate over the extents as (base, limit, perm) tuples in address
+        order.
+        '''
+        return iter(zip(self._bases, self._limits, self._perms))
+
+    def __len__(self):
+        '''
+        The number of pages covered, not the number of extents.
+        '''
+        return sum(l - b for b, l in zip(self._bases, self._limits)) / \
+            PAGE_SIZE
+
+# Marks a page as present in a _Windows permission map, so that pages with
+# no permissions are still present.
+_PRESENT = 8
+
+class _Windows(object):
+    '''
+    The same interface as _Extents, backed by NumPy. Pages are grouped into
+    windows of 'window_pages' pages, such as the pages of one page table, and
+    each window is an array holding the permission bits of each of its pages.
+    Adding a range is a vector OR over each window it touches, and runs of
+    uniform permissions are found with vector comparisons.
+    '''
+    def __init__(self, window_pages):
+        self._window_pages = window_pages
+        self._window_size = window_pages * PAGE_SIZE
+        # Map from window number to its array, and the window numbers in use
+        # in order.
+        self._windows = {}
+        self._keys = []
+
+    def add(self, base, limit, perm, replace=False):
+        if base >= limit:
+            return
+        size = self._window_size
+        perm |= _PRESENT
+        for key in xrange(base / size, (limit - 1) / size + 1):
+            window = self._windows.get(key)
+            if window is None:
+                window = numpy.zeros(self._window_pages, numpy.uint8)
+                self._windows[key] = window
+                insort(self._keys, key)
+            window_base = key * size
+            lo = max(base - window_base, 0) / PAGE_SIZE
+            hi = (min(limit - window_base, size) + PAGE_SIZE - 1) / PAGE_SIZE
+            if replace:
+                window[lo:hi] = perm
+            else:
+                window[lo:hi] |= perm
+
+    def lookup(self, vaddr):
+        window = self._windows.get(vaddr / self._window_size)
+        if window is None:
+            return None
+        perm = int(window[vaddr % self._window_size / PAGE_SIZE])
+        if perm == 0:
+            return None
+        return perm & ~_PRESENT
+
+    def overlapping(self, base, limit):
+        size = self._window_size
+        # The run being built, which may continue into the next window.
+        run_base = run_limit = run_perm = 0
+        for key in self._keys[bisect_left(self._keys, base / size):
+                bisect_left(self._keys, (limit + size - 1) / size)]:
+            window_base = key * size
+            lo = max(base - window_base, 0) / PAGE_SIZE
+            hi = min(limit - window_base, size) / PAGE_SIZE
+            perms = self._windows[key][lo:hi]
+            # The indices at which each run of uniform permissions starts.
+            bounds = [0] + \
+                (numpy.flatnonzero(perms[1:] != perms[:-1]) + 1).tolist() + \
+                [len(perms)]
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                perm = int(perms[start])
+                start = window_base + (lo + start) * PAGE_SIZE
+                end = window_base + (lo + end) * PAGE_SIZE
+                if run_limit == start and run_perm == perm:
+                    run_limit = end
+                    continue
+                if run_perm != 0:
+                    yield run_base, run_limit, run_perm & ~_PRESENT
+                run_base, run_limit, run_perm = start, end, perm
+        if run_perm != 0:
+            yield run_base, run_limit, run_perm & ~_PRESENT
+
+    def __iter__(self):
+        if not self._keys:
+            return iter(())
+        return self.overlapping(0, (self._keys[-1] + 1) * self._window_size)
+
+    def __len__(self):
+        return sum(int(numpy.count_nonzero(w)) for w in self._windows.values())
 
 class PageCollection(object):
-    def __init__(self, name='', arch='arm11', infer_asid=True, pd=None):
+    def __init__(self, name='', arch='arm11', infer_asid=True, pd=None,
+            use_numpy=False):
+        '''
+        If 'use_numpy' is set and NumPy is available, the pages are kept as
+        NumPy arrays of permissions, one per page table. This is faster for
+        address spaces with many small, scattered ranges of pages.
+        '''
         self.name = name
         self.arch = arch
-        self._pages = {}
+        if use_numpy and numpy is not None:
+            self._extents = _Windows(
+                get_arch(arch).page_table.coverage / PAGE_SIZE)
+        else:
+            self._extents = _Extents()
         self._pd = pd
+        self._pd_cap = None
         self._asid = None
         self.infer_asid = infer_asid
-        self._spec = lambda: None
+        # The spec last built, which get_spec updates in place rather than
+        # rebuilding while it is built the same way.
+        self._spec = None
+        self._spec_large_pages = False
+        # Map from each region of the address space built to the virtual
+        # addresses of the frames built for it, the frames themselves, the
+        # tables it owns, keyed on (depth, base vaddr), and the (table, index)
+        # slots it uses in tables shared with other regions. A region is the
+        # part of the address space covered by one page table, or by the
+        # largest frame if that is larger.
+        self._regions = {}
+        # Tables shared between regions, keyed on (depth, base vaddr).
+        self._tables = {}
+        # Indexes of the page tables' worth of address space changed since
+        # the spec was built.
+        self._dirty = set()
+        self._page_counter = 0
+        self._table_counters = {}
+        # Sources of frame contents, sorted by virtual address. None until
+        # contents are first described.
+        self._fill_vaddrs = None
+        self._fills = None
 
     def add_page(self, vaddr, read=False, write=False, execute=False):
-        if vaddr not in self._pages:
-            # Only create this page if we don't already have it.
-            self._pages[vaddr] = {
-                'read':False, \
-                'write':False, \
-                'execute':False, \
-            }
-        # Now upgrade this page's permissions to meet our current requirements.
-        self._pages[vaddr]['read'] |= read
-        self._pages[vaddr]['write'] |= write
-        self._pages[vaddr]['execute'] |= execute
+        # Create this page if we don't already have it and upgrade its
+        # permissions to meet our current requirements.
+        base = round_down(vaddr)
+        self._extents.add(base, base + PAGE_SIZE,
+            _perm_bits(read, write, execute))
+        self._mark_dirty(base, base + PAGE_SIZE)
+
+    def _set_page(self, vaddr, perm):
+        self._extents.add(vaddr, vaddr + PAGE_SIZE, perm, replace=True)
+        self._mark_dirty(vaddr, vaddr + PAGE_SIZE)
 
     def add_pages(self, base, limit, read=False, write=False, execute=False):
-        '''Optimised, batched version of calling add_page in a loop. Prefer
-        add_page unless you're doing something performance critical.'''
+        '''Batched version of calling add_page in a loop for every page in
+        [base, limit). This touches only the extents overlapping the range, so
+        its cost does not depend on the number of pages.'''
         assert base % PAGE_SIZE == 0
-        # Permissions to default to a page we haven't created yet.
-        base_perm = {
-            'read':False,
-            'write':False,
-            'execute':False,
-        }
-        # Permissions to update an existing page.
-        d = {}
-        if read:
-            d['read'] = True
-        if write:
-            d['write'] = True
-        if execute:
-            d['execute'] = True
-        # The following requires a little explanation.
-        #  1. consume() to avoid accumulating a large unused list/generator in
-        #     memory.
-        #  2. Pre-construct d and base_perm to avoid the interpreter
-        #     repeatedly reconstructing them.
-        #  3. __setitem__() rather than 'self._pages[v] = ...' because we can't
-        #     use 'x = y' syntax inside a list comprehension.
-        #  4. A list comprehension because this is faster than a for loop or
-        #     map in this case.
-        #  5. xrange() because it is faster than range().
-        consume(self._pages.__setitem__(v,
-            dict(self._pages.get(v, base_perm).items() + d.items()))
-                for v in xrange(base, limit, PAGE_SIZE))
+        self._extents.add(base, round_up(limit),
+            _perm_bits(read, write, execute))
+        self._mark_dirty(base, limit)
+
+    def _mark_dirty(self, base, limit):
+        if self._spec is None or base >= limit:
+            return
+        coverage = get_arch(self.arch).page_table.coverage
+        self._dirty.update(xrange(base / coverage, (limit - 1) / coverage + 1))
+
+    def add_fill(self, vaddr, source, offset, length):
+        '''
+        Describe the initial contents of [vaddr, vaddr + length) as the bytes
+        at 'offset' in 'source', which must support the buffer interface.
+        Once any fill has been added, frames built by get_spec carry their
+        contents, and bytes without a fill are zero. A zero 'length' just
+        marks the contents as known. Fills must not overlap.
+        '''
+        if self._fills is None:
+            self._fill_vaddrs = []
+            self._fills = []
+            # Every frame now has known contents.
+            for base, limit, _ in self._extents:
+                self._mark_dirty(base, limit)
+        if length == 0:
+            return
+        i = bisect_right(self._fill_vaddrs, vaddr)
+        self._fill_vaddrs.insert(i, vaddr)
+        self._fills.insert(i, (vaddr, length, source, offset))
+        self._mark_dirty(vaddr, vaddr + length)
+
+    def _frame_fill(self, vaddr, size):
+        '''
+        The contents of the frame of 'size' bytes mapped at 'vaddr'.
+        '''
+        if self._fills is None:
+            return None
+        fill = []
+        i = max(bisect_right(self._fill_vaddrs, vaddr) - 1, 0)
+        while i < len(self._fills) and self._fill_vaddrs[i] < vaddr + size:
+            base, length, source, offset = self._fills[i]
+            i += 1
+            start = max(base, vaddr)
+            end = min(base + length, vaddr + size)
+            if start < end:
+                fill.append(FrameFill(start - vaddr, source,
+                    offset + start - base, end - start))
+        return fill
+
+    def extents(self):
+        '''
+        Iterate over the pages as maximal runs of uniform permissions. Each
+        run is a tuple (base, limit, read, write, execute).
+        '''
+        for base, limit, perm in self._extents:
+            yield base, limit, perm & READ != 0, perm & WRITE != 0, \
+                perm & EXECUTE != 0
 
     def __getitem__(self, key):
-        return self._pages[key]
+        '''
+        The permissions of the page at 'key', as a dictionary with the keys
+        'read', 'write' and 'execute'. Setting them changes the page.
+        '''
+        perm = self._extents.lookup(key)
+        if perm is None or key % PAGE_SIZE != 0:
+            raise KeyError(key)
+        return _Page(self, key, perm)
+
+    def __contains__(self, key):
+        return key % PAGE_SIZE == 0 and self._extents.lookup(key) is not None
 
     def __iter__(self):
-        return self._pages.__iter__()
+        for base, limit, _ in self._extents:
+            for vaddr in xrange(base, limit, PAGE_SIZE):
+                yield vaddr
+
+    def __len__(self):
+        return len(self._extents)
 
     def get_page_directory(self):
+        '''
+        The root of the address space and a cap to it. This is a page
+        directory on 32-bit architectures, and the top level table on
+        architectures with more levels of paging.
+        '''
         if not self._pd:
-            self._pd = PageDirectory('pd_%s' % self.name)
-        return self._pd, Cap(self._pd)
+            kind = get_arch(self.arch).levels[0].kind
+            self._pd = _TABLE_TYPES[kind]('%s_%s' % (kind, self.name))
+        # Every caller gets the same cap, as a page directory cap has no
+        # attributes that anyone would want to change.
+        if self._pd_cap is None:
+            self._pd_cap = Cap(self._pd)
+        return self._pd, self._pd_cap
 
     def get_asid(self):
         if not self._asid and self.infer_asid:
@@ -100,45 +409,235 @@ class PageCollection(object):
             self._asid[0] = self.get_page_directory()[1]
         return self._asid
 
-    def get_spec(self):
-        spec = self._spec()
-        if spec:
-            return spec
-
-        spec = Spec(self.arch)
-
-        # Page directory and ASID.
-        pd, pd_cap = self.get_page_directory()
-        spec.add_object(pd)
-        asid = self.get_asid()
-        if asid is not None:
-            spec.add_object(asid)
-
-        # Construct frames and infer page tables from the pages.
-        pts = {}
-        pt_counter = 0
-        for page_counter, page_vaddr in enumerate(self._pages):
-            frame = Frame('frame_%s_%s' % (self.name, page_counter))
-            spec.add_object(frame)
-            page_cap = Cap(frame, read=self._pages[page_vaddr]['read'], \
-                write=self._pages[page_vaddr]['write'], \
-                grant=self._pages[page_vaddr]['execute'])
-            pt_vaddr = page_table_vaddr(self.arch, page_vaddr)
-            if pt_vaddr not in pts:
-                pts[pt_vaddr] = PageTable('pt_%s_%s' % (self.name, pt_counter))
-                pt_counter += 1
-                pt = pts[pt_vaddr]
-                spec.add_object(pt)
-                pt_cap = Cap(pt)
-                pd[page_table_index(self.arch, pt_vaddr)] = pt_cap
-            pts[pt_vaddr][page_index(self.arch, page_vaddr)] = page_cap
-
-        # Cache the result for next time.
-        assert self._spec() is None
-        self._spec = ref(spec)
+    def get_spec(self, large_pages=False):
+        '''
+        Construct a spec for this address space. By default every page is
+        backed by its own 4K frame. If 'large_pages' is set, aligned runs of
+        pages with uniform permissions are instead backed by the largest
+        frames the architecture supports. Frames larger than a page may be
+        mapped into tables above the page tables, such as ARM sections into
+        the page directory, and do not need page tables of their own.
+
+        The spec is kept, and later calls return the same spec. If pages or
+        contents have been added since, only the frames and page tables of
+        the regions they touch are rebuilt.
+        '''
+        arch = get_arch(self.arch)
+        bottom = len(arch.levels) - 1
+        sizes = [(PAGE_SIZE, bottom)]
+        if large_pages:
+            sizes = arch.large_pages + sizes
+        coverage = arch.page_table.coverage
+        region_size = max(coverage, sizes[0][0])
+
+        pd, _ = self.get_page_directory()
+        if self._spec is None or self._spec_large_pages != large_pages:
+            spec = Spec(self.arch)
+
+            # Page directory and ASID. Discard any mappings left over from a
+            # previous construction, as they may not line up with this one.
+            for _, _, _, slots in self._regions.values():
+                for table, index in slots:
+                    if index in table:
+                        del table[index]
+            self._regions = {}
+            self._tables = {}
+            self._page_counter = 0
+            self._table_counters = {}
+            spec.add_object(pd)
+            asid = self.get_asid()
+            if asid is not None:
+                spec.add_object(asid)
+
+            regions = set()
+            for base, limit, _ in self._extents:
+                regions.update(xrange(base / region_size,
+                    (limit - 1) / region_size + 1))
+        else:
+            spec = self._spec
+            scale = region_size / coverage
+            regions = set(i / scale for i in self._dirty)
+
+        for region in sorted(regions):
+            self._build_region(spec, arch, region, region_size, sizes)
+
+        # Keep the result for next time.
+        self._spec = spec
+        self._spec_large_pages = large_pages
+        self._dirty = set()
 
         return spec
 
+    def _build_region(self, spec, arch, region, region_size, sizes):
+        '''
+        Bring the frames, tables and mappings for the given region of the
+        address space up to date. Frames and tables that are still needed
+        are kept, along with the caps mapping them if their rights are
+        unchanged, so references to them from elsewhere stay valid.
+        '''
+        old = self._regions.pop(region, None)
+        old_frames, old_tables, old_slots = {}, {}, []
+        if old is not None:
+            vaddrs, old_objs, old_tables, old_slots = old
+            old_frames = dict(((vaddr, frame.size), frame)
+                for vaddr, frame in itertools.izip(vaddrs, old_objs))
+
+        levels = arch.levels
+        shared = self._tables
+        owned = {}
+        vaddrs, frames = [], []
+        objs, slots = [], []
+        # Every (table, index) mapped, so mappings that are no longer
+        # needed can be found.
+        mapped = set()
+
+        def set_cap(table, index, obj, read=False, write=False, grant=False):
+            if old is None:
+                # There is nothing to keep or clean up.
+                table[index] = Cap(obj, read=read, write=write, grant=grant)
+                return
+            cap = table.slots.get(index)
+            if cap is None or cap.referent is not obj or cap.read != read \
+               or cap.write != write or cap.grant != grant:
+                table[index] = Cap(obj, read=read, write=write, grant=grant)
+            mapped.add((table, index))
+
+        def get_table(depth, vaddr):
+            # The table at the given depth covering vaddr, creating it and
+            # any tables above it that do not exist yet. Tables that cover
+            # no more than a region belong to the region.
+            if depth == 0:
+                return self._pd, True
+            level = levels[depth]
+            tables = owned if level.coverage <= region_size else shared
+            key = (depth, vaddr & ~(level.coverage - 1))
+            table = tables.get(key)
+            if table is not None:
+                return table, tables is shared
+            if tables is owned:
+                table = old_tables.pop(key, None)
+                if table is not None and table not in spec:
+                    # The table was removed from the spec since the last
+                    # build. Use the table the spec maps here instead, if
+                    # there is one.
+                    parent, _ = get_table(depth - 1, vaddr)
+                    cap = parent.slots.get(levels[depth - 1].index(vaddr))
+                    if cap is not None and type(cap.referent) is \
+                       type(table) and cap.referent in spec:
+                        table = cap.referent
+                    else:
+                        table = None
+            if table is None:
+                counter = self._table_counters.get(level.kind, 0)
+                self._table_counters[level.kind] = counter + 1
+                table = _TABLE_TYPES[level.kind]('%s_%s_%s' % (level.kind,
+                    self.name, counter))
+                if tables is owned:
+                    objs.append(table)
+                else:
+                    spec.add_object(table)
+            tables[key] = table
+            parent, parent_shared = get_table(depth - 1, vaddr)
+            index = levels[depth - 1].index(vaddr)
+            set_cap(parent, index, table)
+            if parent_shared and tables is owned:
+                slots.append((parent, index))
+            return table, tables is shared
+
+        # Construct frames and infer tables from the pages. Frames are never
+        # larger than a region and are aligned to their size, so none cross
+        # the edge of the region.
+        region_base = region * region_size
+        for base, limit, perm in self._extents.overlapping(region_base,
+                region_base + region_size):
+            read, write, execute = perm & READ != 0, perm & WRITE != 0, \
+                perm & EXECUTE != 0
+            page_vaddr = base
+            table_key = None
+            while page_vaddr < limit:
+                # Find the largest frame that is aligned at this address and
+                # does not extend past the end of this run. The last entry
+                # in sizes is a page, which always fits.
+                for size, depth in sizes:
+                    if page_vaddr & (size - 1) == 0 and \
+                       page_vaddr + size <= limit:
+                        break
+                fill = self._frame_fill(page_vaddr, size)
+                level = levels[depth]
+                key = (depth, page_vaddr & ~(level.coverage - 1))
+                index = (page_vaddr >> level.shift) & level.mask
+                # The frame this collection made for the page, which is the
+                # one mapped unless it has since left the spec.
+                own = frame = None
+                if old_frames:
+                    own = frame = old_frames.pop((page_vaddr, size), None)
+                if own is not None and own not in spec:
+                    # For instance, Dedup replaced it with a frame shared
+                    # with another spec. Keep mapping the frame the spec
+                    # maps here instead, as long as it still fits the page.
+                    if key != table_key:
+                        table, table_shared = get_table(depth, page_vaddr)
+                        table_key = key
+                    cap = table.slots.get(index)
+                    frame = None
+                    if cap is not None and isinstance(cap.referent, Frame) \
+                       and cap.referent in spec and \
+                       cap.referent.size == size and not write and \
+                       _same_fill(own.fill, fill):
+                        frame = cap.referent
+                elif own is not None:
+                    own.fill = fill
+                if frame is None:
+                    own = frame = Frame('frame_%s_%s' % (self.name,
+                        self._page_counter), size, fill=fill)
+                    self._page_counter += 1
+                    objs.append(frame)
+                vaddrs.append(page_vaddr)
+                frames.append(own)
+                # Consecutive pages are usually in the same table.
+                if key != table_key:
+                    table, table_shared = get_table(depth, page_vaddr)
+                    table_key = key
+                if old is None:
+                    table[index] = Cap(frame, read=read, write=write,
+                        grant=execute)
+                else:
+                    set_cap(table, index, frame, read, write, execute)
+                if table_shared:
+                    slots.append((table, index))
+                page_vaddr += size
+
+        # Drop whatever the region no longer needs: mappings in shared
+        # tables and in the region's own tables that were kept, and frames
+        # and tables that were not kept.
+        if old is not None:
+            for table, index in old_slots:
+                if (table, index) not in mapped and index in table:
+                    del table[index]
+            for table in owned.values():
+                for index in table.slots.keys():
+                    if (table, index) not in mapped:
+                        del table[index]
+            for obj in old_frames.values() + old_tables.values():
+                if obj in spec:
+                    spec.remove_object(obj)
+
+        # The region's new objects are added to the spec together, which is
+        # cheaper than adding them one at a time.
+        spec.add_objects(objs)
+        if frames:
+            self._regions[region] = (vaddrs, frames, owned, slots)
+
+def _same_fill(a, b):
+    '''
+    Whether two frame fills describe the same contents in the same way.
+    '''
+    if a is None or b is None:
+        return a is b
+    return len(a) == len(b) and all(x.dest_offset == y.dest_offset and
+        x.source is y.source and x.offset == y.offset and
+        x.length == y.length for x, y in itertools.izip(a, b))
+
 def create_address_space(regions, name='', arch='arm11'):
     assert isinstance(regions, list)
 
@@ -146,10 +645,8 @@ def create_address_space(regions, name='', arch='arm11'):
     for r in regions:
         assert 'start' in r
         assert 'end' in r
-        v = round_down(r['start'])
-        while round_down(v) < r['end']:
-            pages.add_page(v, r.get('read', False), r.get('write', False), \
-                r.get('execute', False))
-            v += PAGE_SIZE
+        pages.add_pages(round_down(r['start']), r['end'],
+            r.get('read', False), r.get('write', False),
+            r.get('execute', False))
 
     return pages
@@ -0,0 +1,218 @@
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+"""
+A parser for the CapDL text this module generates. Input is consumed a line
+at a time, so only the resulting objects are held in memory, never the text.
+"""
+
+from Cap import Cap
+from Object import ASIDPool, AsyncEndpoint, CNode, Endpoint, Frame, \
+    IODevice, IOPageTable, IOPorts, IRQ, PageDirectory, PageTable, PDPT, \
+    PGD, PML4, PUD, TCB, Untyped, VCPU
+from Spec import Spec
+import re
+
+_object_line = re.compile(r'^(\S+)\s*=\s*(\w+)\s*(?:\((.*)\))?$')
+_slot_line = re.compile(r'^(?:(\S+):\s+)?(\S+)\s*(?:\((.*)\))?$')
+_irq_line = re.compile(r'^(\d+)L?:\s*(\S+)$')
+_frame_size = re.compile(r'^(\d+)([kMG])$')
+_bits = re.compile(r'^(\d+) bits$')
+_io_ports = re.compile(r'^(\d+)k ports$')
+_io_device = re.compile(
+    r'^domainID:\s*(\d+),\s*(0x[0-9a-fA-F]+):(\d+)\.(\d+)$')
+_ports = re.compile(r'^\[(\d+)\.\.(\d+)\]$')
+_rights = re.compile(r'^[RWX]+$')
+
+_units = {'k':1024, 'M':1024 * 1024, 'G':1024 * 1024 * 1024}
+
+def _int(s):
+    return int(s.rstrip('L'), 0)
+
+def _fields(args):
+    """
+    Split 'key: value, key: value' into a dictionary. Values may not contain
+    commas, except inside square brackets.
+    """
+    fields = {}
+    for match in re.finditer(r'(\w+):\s*(\[[^\]]*\]|[^,]*)', args):
+        fields[match.group(1)] = match.group(2).strip()
+    return fields
+
+def _parse_object(name, kind, args):
+    if kind == 'frame':
+        parts = [x.strip() for x in args.split(',')]
+        m = _frame_size.match(parts[0])
+        if not m:
+            raise ValueError('invalid frame size %s' % parts[0])
+        size = int(m.group(1)) * _units[m.group(2)]
+        paddr = _int(_fields(args).get('paddr', '0'))
+        return Frame(name, size, paddr)
+    elif kind == 'cnode':
+        m = _bits.match(args)
+        if not m:
+            raise ValueError('invalid cnode size %s' % args)
+        return CNode(name, int(m.group(1)))
+    elif kind == 'ut':
+        m = _bits.match(args)
+        if not m:
+            raise ValueError('invalid untyped size %s' % args)
+        return Untyped(name, int(m.group(1)))
+    elif kind == 'tcb':
+        fields = _fields(args)
+        init = fields.get('init', '[]')[1:-1]
+        return TCB(name, _int(fields.get('addr', '0')),
+            _int(fields.get('ip', '0')), _int(fields.get('sp', '0')),
+            fields.get('elf', ''), int(fields.get('prio', 254)),
+            [_int(x) for x in init.split(',') if x.strip()],
+            int(fields['dom']) if 'dom' in fields else None)
+    elif kind == 'io_ports':
+        m = _io_ports.match(args)
+        if not m:
+            raise ValueError('invalid IO port range %s' % args)
+        return IOPorts(name, int(m.group(1)) * 1024)
+    elif kind == 'io_device':
+        m = _io_device.match(args)
+        if not m:
+            raise ValueError('invalid IO device %s' % args)
+        return IODevice(name, int(m.group(1)), int(m.group(2), 16),
+            int(m.group(3)), int(m.group(4)))
+    elif kind == 'io_pt':
+        return IOPageTable(name, int(_fields(args).get('level', 1)))
+    simple = {
+        'pt':PageTable,
+        'pd':PageDirectory,
+        'pdpt':PDPT,
+        'pml4':PML4,
+        'pud':PUD,
+        'pgd':PGD,
+        'asid_pool':ASIDPool,
+        'ep':Endpoint,
+        'aep':AsyncEndpoint,
+        'irq':IRQ,
+        'vcpu':VCPU,
+    }
+    if kind not in simple:
+        raise ValueError('unknown object type %s' % kind)
+    return simple[kind](name)
+
+def _parse_cap(referent, args):
+    cap = Cap(referent)
+    if not args:
+        return cap
+    for extra in [x.strip() for x in args.split(',')]:
+        if _rights.match(extra):
+            cap.read = 'R' in extra
+            cap.write = 'W' in extra
+            cap.grant = 'X' in extra
+        elif extra == 'uncached':
+            cap.set_cached(False)
+        else:
+            key, _, value = extra.partition(':')
+            value = value.strip()
+            if key == 'badge':
+                cap.set_badge(_int(value))
+            elif key == 'guard':
+                cap.set_guard(_int(value))
+            elif key == 'guard_size':
+                cap.set_guard_size(_int(value))
+            elif key == 'ports':
+                m = _ports.match(value)
+                if not m:
+                    raise ValueError('invalid port range %s' % value)
+                cap.set_ports(range(int(m.group(1)), int(m.group(2)) + 1))
+            else:
+                raise ValueError('unknown cap attribute %s' % extra)
+    return cap
+
+def _slot_key(index):
+    if index is None:
+        return None
+    try:
+        return _int(index)
+    except ValueError:
+        return index
+
+def parse(lines):
+    """
+    Parse CapDL text from an iterable of lines, such as an open file, and
+    return the spec it describes. Errors are reported as a ValueError
+    carrying the offending line number.
+    """
+    spec = Spec()
+    section = None
+    container = None
+    number = 0
+    try:
+        for number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+
+            if section is None:
+                if line.startswith('arch '):
+                    spec.arch = line[len('arch '):].strip()
+                elif line in ['objects {', 'caps {', 'irq maps {']:
+                    section = line[:-len(' {')]
+                else:
+                    raise ValueError('unexpected %s' % line)
+
+            elif line == '}' and container is None:
+                section = None
+
+            elif section == 'objects':
+                m = _object_line.match(line)
+                if not m:
+                    raise ValueError('invalid object %s' % line)
+                name, kind, args = m.groups()
+                spec.add_object(_parse_object(name, kind, (args or '').strip()))
+
+            elif section == 'caps':
+                if container is None:
+                    if not line.endswith('{'):
+                        raise ValueError('expected a container, got %s' % line)
+                    name = line[:-1].strip()
+                    container = spec.by_name(name)
+                    if container is None or not container.is_container():
+                        raise ValueError('%s is not a known container' % name)
+                elif line == '}':
+                    container = None
+                else:
+                    m = _slot_line.match(line)
+                    if not m:
+                        raise ValueError('invalid cap %s' % line)
+                    index, name, args = m.groups()
+                    referent = spec.by_name(name)
+                    if referent is None:
+                        raise ValueError('unknown object %s' % name)
+                    container[_slot_key(index)] = _parse_cap(referent, args)
+
+            elif section == 'irq maps':
+                m = _irq_line.match(line)
+                if not m:
+                    raise ValueError('invalid IRQ mapping %s' % line)
+                irq = spec.by_name(m.group(2))
+                if not isinstance(irq, IRQ):
+                    raise ValueError('%s is not a known IRQ' % m.group(2))
+                irq.number = int(m.group(1))
+
+    except (ValueError, AssertionError) as e:
+        raise ValueError('line %d: %s' % (number, e))
+
+    if section is not None:
+        raise ValueError('unexpected end of input in %s section' % section)
+    return spec
+
+def parse_file(path):
+    """
+    Parse the CapDL file at 'path'.
+    """
+    with open(path, 'r') as f:
+        return parse(f)
@@ -0,0 +1,194 @@
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+"""
+Planning where the objects of a spec will be placed in untyped memory, so we
+can tell whether a spec fits before trying to boot it.
+"""
+
+from Arch import get_arch
+from Object import ASIDPool, AsyncEndpoint, CNode, Endpoint, Frame, \
+    IOPageTable, PageDirectory, PageTable, PDPT, PGD, PML4, PUD, TCB, \
+    Untyped, VCPU, calculate_size
+from util import ceil_log2
+import bisect, itertools
+
+# The CapDL names of the types of object whose size is fixed on a given
+# architecture. See Arch.object_sizes.
+_KINDS = {
+    TCB:'tcb',
+    Endpoint:'ep',
+    AsyncEndpoint:'aep',
+    PageTable:'pt',
+    PageDirectory:'pd',
+    PDPT:'pdpt',
+    PML4:'pml4',
+    PUD:'pud',
+    PGD:'pgd',
+    ASIDPool:'asid_pool',
+    IOPageTable:'io_pt',
+    VCPU:'vcpu',
+}
+
+def object_size_bits(arch, obj):
+    """
+    The amount of untyped memory an object takes on the given architecture,
+    as a power of two, or None if it is not created from untyped memory.
+    """
+    arch = get_arch(arch)
+    if isinstance(obj, Frame):
+        return ceil_log2(obj.size)
+    elif isinstance(obj, CNode):
+        size_bits = obj.size_bits
+        if size_bits == 'auto':
+            size_bits = calculate_size(obj)
+        return size_bits + arch.slot_bits
+    elif isinstance(obj, Untyped):
+        return obj.size_bits
+    for cls in type(obj).__mro__:
+        if cls in _KINDS:
+            return arch.object_sizes.get(_KINDS[cls])
+    return None
+
+class Plan(object):
+    """
+    The outcome of plan.
+    """
+    def __init__(self):
+        # Map from each object placed to the untyped it is placed in and its
+        # offset within the untyped.
+        self.placements = {}
+        # Map from each untyped to the objects placed in it in order of
+        # offset, which is the order in which they must be created.
+        self.contents = {}
+        # Objects that could not be placed.
+        self.unplaced = []
+        # Bytes of untyped memory used, and left over in untypeds that do not
+        # hold device frames.
+        self.used = 0
+        self.headroom = 0
+        # The largest object, in bytes, that could still be placed.
+        self.largest_free = 0
+
+    def fits(self):
+        return not self.unplaced
+
+    def fragmentation(self):
+        """
+        The proportion of the headroom outside the largest free block.
+        """
+        if self.headroom == 0:
+            return 0.0
+        return 1.0 - float(self.largest_free) / self.headroom
+
+    def __repr__(self):
+        return 'used %d bytes, %d bytes headroom (largest free %d bytes, ' \
+            '%.0f%% fragmented), %d objects unplaced' % (self.used,
+            self.headroom, self.largest_free, self.fragmentation() * 100,
+            len(self.unplaced))
+
+def _place(placement, objs, untyped, offset, size_bits):
+    placement.update(itertools.izip(objs, itertools.izip(
+        itertools.repeat(untyped),
+        xrange(offset, offset + (len(objs) << size_bits), 1 << size_bits))))
+
+def plan(spec, untypeds, arch=None):
+    """
+    Plan the placement of the objects in 'spec' in 'untypeds', returning a
+    Plan. Each untyped is an Untyped, or an (Untyped, paddr) pair giving its
+    physical address. Frames with a physical address are device frames,
+    which are placed in the untyped containing their address. An untyped
+    holding device frames holds nothing else. Other objects are created in
+    order of descending size, which keeps every object aligned without
+    padding, and placed in the smallest untyped they fit in first. 'arch'
+    defaults to the spec's.
+    """
+    arch = arch or spec.arch
+
+    # Bucket the objects by size. Objects whose size depends only on their
+    # type are the common case, so remember those sizes by type.
+    buckets = {}
+    devices = []
+    type_sizes = {}
+    for obj in spec:
+        t = type(obj)
+        if t in type_sizes:
+            size_bits = type_sizes[t]
+        elif issubclass(t, Frame) and obj.paddr != 0:
+            devices.append(obj)
+            continue
+        elif issubclass(t, (Frame, CNode, Untyped)):
+            size_bits = object_size_bits(arch, obj)
+        else:
+            size_bits = type_sizes[t] = object_size_bits(arch, obj)
+        if size_bits is not None:
+            buckets.setdefault(size_bits, []).append(obj)
+
+    result = Plan()
+    regions = []
+    for untyped in untypeds:
+        paddr = None
+        if isinstance(untyped, tuple):
+            untyped, paddr = untyped
+        regions.append([untyped, paddr, 0, 1 << untyped.size_bits])
+        result.contents[untyped] = []
+
+    # Place device frames in the untypeds containing them, taking those
+    # untypeds out of use for anything else.
+    located = sorted((r[1], r) for r in regions if r[1] is not None)
+    bases = [base for base, _ in located]
+    reserved = set()
+    ends = {}
+    for frame in sorted(devices, key=lambda f: f.paddr):
+        i = bisect.bisect_right(bases, frame.paddr) - 1
+        if i < 0 or frame.paddr % frame.size != 0:
+            result.unplaced.append(frame)
+            continue
+        base, region = located[i]
+        untyped = region[0]
+        offset = frame.paddr - base
+        if offset + frame.size > region[3] or \
+           offset < ends.get(untyped, 0):
+            result.unplaced.append(frame)
+            continue
+        ends[untyped] = offset + frame.size
+        reserved.add(untyped)
+        result.placements[frame] = (untyped, offset)
+        result.contents[untyped].append(frame)
+        result.used += frame.size
+
+    free = sorted((r for r in regions if r[0] not in reserved),
+        key=lambda r: r[3])
+    for size_bits in sorted(buckets, reverse=True):
+        objs = buckets[size_bits]
+        placed = 0
+        for region in free:
+            if placed == len(objs):
+                break
+            untyped, _, watermark, limit = region
+            count = min((limit - watermark) >> size_bits, len(objs) - placed)
+            if count <= 0:
+                continue
+            chunk = objs[placed:placed + count]
+            _place(result.placements, chunk, untyped, watermark, size_bits)
+            result.contents[untyped].extend(chunk)
+            region[2] = watermark + (count << size_bits)
+            placed += count
+        result.used += placed << size_bits
+        result.unplaced.extend(objs[placed:])
+
+    for _, _, watermark, limit in free:
+        if watermark < limit:
+            result.headroom += limit - watermark
+            # The free space is the top of a naturally aligned region, so its
+            # largest aligned block is the largest power of two it holds.
+            result.largest_free = max(result.largest_free,
+                1 << ((limit - watermark).bit_length() - 1))
+    return result
@@ -8,49 +8,281 @@
 # @TAG(NICTA_BSD)
 #
 
-from Object import IRQ, Object, PageTable
+from Object import ASIDPool, ContainerObject, IRQ, Object, TCB
+from Planner import object_size_bits
+from util import OrderedSet
+import collections, itertools, operator
+
+class PruneReport(object):
+    '''
+    The outcome of Spec.prune.
+    '''
+    def __init__(self):
+        # Objects removed, in the order they appeared in the spec.
+        self.dropped = []
+        # Bytes of untyped memory the removed objects would have used.
+        self.bytes_saved = 0
+
+    def __repr__(self):
+        return 'dropped %d objects (%d bytes)' % \
+            (len(self.dropped), self.bytes_saved)
 
 class Spec(object):
     """
-    A CapDL specification.
+    A CapDL specification. Alongside the objects themselves, a spec keeps
+    indexes of its objects by name, by class and by label that are updated
+    as objects are added and removed.
     """
     def __init__(self, arch='arm11'):
         self.arch = arch
-        self.objs = set()
+        self.objs = OrderedSet()
+        self._names = {}
+        # Ordered so that iterating by type is deterministic.
+        self._types = collections.OrderedDict()
+        self._labels = {}
+        self._label_of = {}
 
-    def add_object(self, obj):
+    def add_object(self, obj, label=None):
+        """
+        Add an object under the given label. Adding an object already in the
+        spec does nothing. Names are expected to be unique within a spec; if
+        two objects share a name, lookups by name find the one added last.
+        """
         assert isinstance(obj, Object)
+        if obj in self._label_of:
+            return
         self.objs.add(obj)
+        self._names[obj.name] = obj
+        t = type(obj)
+        if t not in self._types:
+            self._types[t] = OrderedSet()
+        self._types[t].add(obj)
+        if label not in self._labels:
+            self._labels[label] = OrderedSet()
+        self._labels[label].add(obj)
+        self._label_of[obj] = label
+
+    def add_objects(self, objs, label=None):
+        """
+        Add many objects with the same label. This is equivalent to calling
+        add_object for each, but cheaper.
+        """
+        label_of = self._label_of
+        new = [obj for obj in objs if obj not in label_of]
+        assert all(isinstance(obj, Object) for obj in new)
+        self.objs.update(new)
+        self._names.update(itertools.izip(
+            itertools.imap(operator.attrgetter('name'), new), new))
+        for t, group in itertools.groupby(new, type):
+            if t not in self._types:
+                self._types[t] = OrderedSet()
+            self._types[t].update(group)
+        if label not in self._labels:
+            self._labels[label] = OrderedSet()
+        self._labels[label].update(new)
+        label_of.update(dict.fromkeys(new, label))
+
+    def remove_object(self, obj):
+        self.objs.remove(obj)
+        if self._names.get(obj.name) is obj:
+            del self._names[obj.name]
+        self._types[type(obj)].remove(obj)
+        self._remove_label(obj)
+
+    def _remove_label(self, obj):
+        label = self._label_of.pop(obj)
+        objs = self._labels[label]
+        objs.remove(obj)
+        if not objs:
+            del self._labels[label]
+
+    def relabel(self, obj, label):
+        """
+        Move an object in this spec to a different label. It is placed after
+        the objects already in that label.
+        """
+        if self._label_of[obj] == label:
+            return
+        self._remove_label(obj)
+        if label not in self._labels:
+            self._labels[label] = OrderedSet()
+        self._labels[label].add(obj)
+        self._label_of[obj] = label
 
     def merge(self, other):
         assert isinstance(other, Spec)
-        self.objs.update(other)
+        for obj in other:
+            self.add_object(obj, other.label_of(obj))
+
+    def prune(self, roots=()):
+        """
+        A new spec holding only the objects reachable through caps from the
+        TCBs, the IRQs and the given roots, which may be objects or names,
+        along with a PruneReport of what was left out. ASID pools are kept
+        if they hold a cap to a reachable object. The objects are shared
+        rather than copied and keep their labels.
+        """
+        reached = set()
+        # Objects reached whose caps are still to be followed. This is an
+        # explicit stack rather than recursion, so arbitrarily deep chains of
+        # containers can be followed.
+        pending = []
+        for obj in itertools.chain(self.of_type(TCB), self.of_type(IRQ),
+                roots):
+            if isinstance(obj, str):
+                obj = self[obj]
+            if obj not in reached:
+                reached.add(obj)
+                pending.append(obj)
+        while pending:
+            obj = pending.pop()
+            if not obj.is_container():
+                continue
+            for cap in obj.slots.itervalues():
+                if cap is not None and cap.referent not in reached:
+                    reached.add(cap.referent)
+                    pending.append(cap.referent)
+        for pool in self.of_type(ASIDPool):
+            if pool not in reached and any(cap is not None and
+                    cap.referent in reached
+                    for cap in pool.slots.itervalues()):
+                reached.add(pool)
+
+        spec = Spec(self.arch)
+        report = PruneReport()
+        label_of = self._label_of
+        for obj in self.objs:
+            if obj in reached:
+                spec.add_object(obj, label_of[obj])
+            else:
+                report.dropped.append(obj)
+                size_bits = object_size_bits(self.arch, obj)
+                if size_bits is not None:
+                    report.bytes_saved += 1 << size_bits
+        return spec, report
+
+    def cap_graph(self):
+        """
+        The capability graph of this spec as flat arrays. See CapGraph.
+        """
+        from CapGraph import build
+        return build(self)
+
+    def by_name(self, name):
+        """
+        The object with the given name, or None if there is no such object.
+        """
+        return self._names.get(name)
+
+    def of_type(self, cls):
+        """
+        Iterate over the objects that are instances of the given class.
+        """
+        for t, objs in self._types.items():
+            if issubclass(t, cls):
+                for obj in objs:
+                    yield obj
+
+    def containers(self):
+        """
+        Iterate over the objects that may contain caps.
+        """
+        return self.of_type(ContainerObject)
+
+    def by_label(self, label):
+        """
+        Iterate over the objects with the given label, in the order they were
+        added or relabelled.
+        """
+        return iter(self._labels.get(label, ()))
+
+    def label_count(self, label):
+        """
+        The number of objects with the given label.
+        """
+        return len(self._labels.get(label, ()))
+
+    def extract(self, label):
+        """
+        A new spec holding the objects with the given label, under the same
+        label. The objects are shared rather than copied, so caps to objects
+        outside the label are left dangling.
+        """
+        spec = Spec(self.arch)
+        spec.add_objects(self._labels.get(label, ()), label)
+        return spec
+
+    def label_of(self, obj):
+        return self._label_of[obj]
+
+    def labels(self):
+        """
+        Iterate over the labels in use.
+        """
+        return iter(self._labels)
 
     def __getitem__(self, key):
-        return self.objs[key]
+        if key not in self._names:
+            raise KeyError(key)
+        return self._names[key]
+
+    def __contains__(self, obj):
+        return obj in self._label_of
+
+    def __len__(self):
+        return len(self.objs)
 
     def __iter__(self):
         return self.objs.__iter__()
 
+    def iter_lines(self):
+        """
+        Generate the CapDL text for this spec one line at a time, without
+        trailing newlines.
+        """
+        # Architecture; arm11 or ia32
+        yield 'arch %s' % self.arch
+        yield ''
+
+        # Kernel objects
+        yield 'objects {'
+        if not self.objs:
+            yield ''
+        for obj in self.objs:
+            yield str(obj)
+        yield '}'
+        yield ''
+
+        # Capabilities to kernel objects
+        yield 'caps {'
+        empty = True
+        for obj in self.containers():
+            empty = False
+            for line in obj.iter_contents():
+                yield line
+        if empty:
+            yield ''
+        yield '}'
+        yield ''
+
+        # Mapping from interrupt numbers to IRQ objects
+        yield 'irq maps {'
+        empty = True
+        for irq in self.of_type(IRQ):
+            if irq.number is not None:
+                empty = False
+                yield '%d: %s' % (irq.number, irq.name)
+        if empty:
+            yield ''
+        yield '}'
+
+    def write(self, fp):
+        """
+        Write the CapDL text for this spec to the writable stream 'fp'.
+        """
+        for line in self.iter_lines():
+            fp.write(line)
+            fp.write('\n')
+
     def __repr__(self):
-        return 'arch %(arch)s\n\n' \
-               'objects {\n%(objs)s\n}\n\n' \
-               'caps {\n%(caps)s\n}\n\n' \
-               'irq maps {\n%(irqs)s\n}' % {
-
-            # Architecture; arm11 or ia32
-            'arch':self.arch,
-
-            # Kernel objects
-            'objs':'\n'.join(map(str, self.objs)),
-
-            # Capabilities to kernel objects
-            'caps':'\n'.join(map(lambda x: x.print_contents(),
-                        filter(lambda x: x.is_container(),
-                         self.objs))),
-
-            # Mapping from interrupt numbers to IRQ objects
-            'irqs':'\n'.join(map(lambda x: '%d: %s' % (x.number, x.name),
-                        filter(lambda x: isinstance(x, IRQ) and x.number is not None,
-                        self.objs))),
-        }
+        return '\n'.join(self.iter_lines())
@@ -9,17 +9,19 @@
 #
 
 from Cap import Cap
-from ELF import ELF
+from ELF import ELF, NoSymbolTable
 from Object import Frame, PageTable, PageDirectory, ASIDPool, CNode, Endpoint, \
                    AsyncEndpoint, TCB, Untyped, IOPorts, IODevice, IOPageTable, \
-                   IRQ
+                   IRQ, FrameFill, PDPT, PML4, PUD, PGD
 from Spec import Spec
+from Binary import SpecImage
 from Allocator import seL4_UntypedObject, seL4_TCBObject, seL4_EndpointObject, \
     seL4_AsyncEndpointObject, seL4_CapTableObject, seL4_ARM_SmallPageObject, \
     seL4_ARM_PageTableObject, seL4_ARM_PageDirectoryObject, seL4_IA32_4K, \
     seL4_IA32_PageTableObject, seL4_IA32_PageDirectoryObject, \
     seL4_IA32_IOPageTableObject, seL4_CanRead, seL4_CanWrite, seL4_CanGrant, \
     seL4_AllRights, ObjectAllocator, CSpaceAllocator, seL4_FrameObject, \
-    seL4_PageDirectoryObject
+    seL4_PageDirectoryObject, MultiLevelCSpaceAllocator, register_object_type
 from PageCollection import PageCollection, create_address_space
+from Arch import get_arch
 from util import page_table_vaddr, page_table_index, page_index, page_vaddr
@@ -12,6 +12,9 @@
 Various internal utility functions. Pay no mind to this file.
 """
 
+from Arch import get_arch
+import itertools
+
 # Size of a frame and page (applies to all architectures)
 FRAME_SIZE = 4096 # bytes
 PAGE_SIZE = 4096 # bytes
@@ -22,42 +25,44 @@ def round_down(n, alignment=FRAME_SIZE):
     """
     return n / alignment * alignment
 
+def round_up(n, alignment=FRAME_SIZE):
+    """
+    Round a number up to 'alignment'.
+    """
+    return (n + alignment - 1) / alignment * alignment
+
+def ceil_log2(n):
+    """
+    The smallest x such that 2 ** x >= n.
+    """
+    return max(n - 1, 0).bit_length()
+
 def page_table_coverage(arch):
     """
     The number of bytes a page table covers.
     """
-    if arch.lower() in ['x86', 'ia32']:
-        # On IA32 a page table covers 4M
-        return 4 * 1024 * 1024
-    elif arch.lower() in ['arm', 'arm11']:
-        # On ARM a page table covers 1M
-        return 1 * 1024 * 1024
-    else:
-        # NB: If you end up in this branch while dealing with an ELF that you
-        # are reasonably sure is ARM, chances are you don't have a recent
-        # enough version of pyelftools. ARM support was only added recently.
-        raise NotImplementedError
+    return get_arch(arch).page_table.coverage
 
 def page_table_vaddr(arch, vaddr):
     """
     The base virtual address of a page table, derived from the virtual address
     of a location within that table's coverage.
     """
-    return round_down(vaddr, page_table_coverage(arch))
+    return get_arch(arch).page_table.base(vaddr)
 
 def page_table_index(arch, vaddr):
     """
     The index of a page table within a containing page directory, derived from
     the virtual address of a location within that table's coverage.
     """
-    return vaddr / page_table_coverage(arch)
+    return get_arch(arch).page_directory.index(vaddr)
 
 def page_index(arch, vaddr):
     """
     The index of a page within a containing page table, derived from the
     virtual address of a location within that page.
     """
-    return vaddr % page_table_coverage(arch) / PAGE_SIZE
+    return get_arch(arch).page_table.index(vaddr)
 
 def page_vaddr(vaddr):
     """
@@ -65,3 +70,275 @@ def page_vaddr(vaddr):
     location within that page.
     """
     return vaddr / PAGE_SIZE * PAGE_SIZE
+
+def slot_state(obj):
+    """
+    The attributes of an object whose class defines __slots__, as a
+    dictionary, for pickling. Pickle's older protocols refuse such objects
+    unless they give their state explicitly.
+    """
+    state = dict(getattr(obj, '__dict__', {}))
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, '__slots__', ()):
+            if hasattr(obj, name):
+                state[name] = getattr(obj, name)
+    return state
+
+def set_slot_state(obj, state):
+    """
+    Restore the attributes of an object from the result of slot_state.
+    """
+    for name, value in state.items():
+        setattr(obj, name, value)
+
+# Marks a removed entry in an OrderedSet.
+_HOLE = object()
+
+class OrderedSet(object):
+    """
+    A set that remembers insertion order. Removal leaves a hole in the order
+    that is compacted away once holes outnumber members, so adding, removing
+    and membership testing are all O(1) amortised.
+    """
+    def __init__(self, iterable=()):
+        self._items = []
+        self._index = {}
+        self.update(iterable)
+
+    def add(self, item):
+        if item not in self._index:
+            self._index[item] = len(self._items)
+            self._items.append(item)
+
+    def update(self, iterable):
+        index = self._index
+        new = [item for item in iterable if item not in index]
+        if len(set(new)) == len(new):
+            # The common case, in which the new items are distinct, can be
+            # done in bulk.
+            index.update(itertools.izip(new, itertools.count(len(self._items))))
+            self._items.extend(new)
+        else:
+            for item in new:
+                self.add(item)
+
+    def discard(self, item):
+        index = self._index.pop(item, None)
+        if index is None:
+            return
+        self._items[index] = _HOLE
+        if len(self._items) > 2 * len(self._index) + 8:
+            self._items = [x for x in self._items if x is not _HOLE]
+            self._index = dict((x, i) for i, x in enumerate(self._items))
+
+    def remove(self, item):
+        if item not in self._index:
+            raise KeyError(item)
+        self.discard(item)
+
+    def __contains__(self, item):
+        return item in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        for item in self._items:
+            if item is not _HOLE:
+                yield item
+
+    def __eq__(self, other):
+        # Compare in order against sequences and without regard to order
+        # against unordered sets.
+        if isinstance(other, (OrderedSet, list, tuple)):
+            return len(self) == len(other) and list(self) == list(other)
+        elif isinstance(other, (set, frozenset)):
+            return len(self) == len(other) and \
+                all(x in self._index for x in other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __getstate__(self):
+        # Holes are marked with an object that would not survive pickling.
+        return list(self)
+
+    def __setstate__(self, state):
+        self.__init__(state)
+
+    def __repr__(self):
+        return 'OrderedSet(%s)' % list(self)
+
+# Marks an empty slot in a SlotMap's list.
+_EMPTY = object()
+
+# Types of slot number.
+_SLOT_TYPES = (int, long)
+
+class SlotMap(object):
+    """
+    The contents of a cap container, keyed by slot. Slot numbers that are
+    densely populated from zero, such as those of a full page table, are
+    kept in a list indexed by slot number. Any others are kept in a
+    dictionary. The list is created once at least half the slots up to the
+    largest are in use and dropped when fewer than a quarter are. Iteration
+    is in order of slot number, followed by any other keys.
+    """
+    __slots__ = ('_list', '_count', '_dict', '_ints', '_max')
+
+    def __init__(self):
+        # Numbered slots below len(_list) are in _list, which holds _count
+        # entries. Everything else is in _dict, which holds _ints slot
+        # numbers, the largest of which is _max.
+        self._list = None
+        self._count = 0
+        self._dict = {}
+        self._ints = 0
+        self._max = -1
+
+    def __setitem__(self, key, value):
+        if type(key) not in _SLOT_TYPES or key < 0:
+            self._dict[key] = value
+            return
+        l = self._list
+        if l is not None:
+            if key < len(l):
+                if l[key] is _EMPTY:
+                    self._count += 1
+                l[key] = value
+                return
+            elif key == len(l) and not self._ints:
+                # Filling in order.
+                l.append(value)
+                self._count += 1
+                return
+        if key not in self._dict:
+            self._ints += 1
+            if key > self._max:
+                self._max = key
+        self._dict[key] = value
+        if 2 * (self._count + self._ints) >= self._max + 1:
+            self._densify()
+
+    def _densify(self):
+        # Move every numbered slot in the dictionary into the list,
+        # extending it as far as the largest.
+        l = self._list or []
+        l.extend([_EMPTY] * (self._max + 1 - len(l)))
+        for key in [k for k in self._dict
+                if type(k) in _SLOT_TYPES and k >= 0]:
+            l[key] = self._dict.pop(key)
+        self._list = l
+        self._count += self._ints
+        self._ints = 0
+        self._max = -1
+
+    def _sparsify(self):
+        for key, value in enumerate(self._list):
+            if value is not _EMPTY:
+                self._dict[key] = value
+        self._list = None
+        self._count = 0
+        self._recount()
+
+    def _recount(self):
+        ints = [k for k in self._dict if type(k) in _SLOT_TYPES and k >= 0]
+        self._ints = len(ints)
+        self._max = max(ints) if ints else -1
+
+    def __getitem__(self, key):
+        l = self._list
+        if l is not None and type(key) in _SLOT_TYPES and 0 <= key < len(l):
+            value = l[key]
+            if value is _EMPTY:
+                raise KeyError(key)
+            return value
+        return self._dict[key]
+
+    def __delitem__(self, key):
+        l = self._list
+        if l is not None and type(key) in _SLOT_TYPES and 0 <= key < len(l):
+            if l[key] is _EMPTY:
+                raise KeyError(key)
+            l[key] = _EMPTY
+            self._count -= 1
+            # Keep the last entry of the list in use, so the list's length
+            # gives its largest slot number.
+            while l and l[-1] is _EMPTY:
+                l.pop()
+            if 4 * self._count < len(l):
+                self._sparsify()
+            return
+        del self._dict[key]
+        if type(key) in _SLOT_TYPES and key >= 0:
+            self._ints -= 1
+            if key == self._max:
+                self._recount()
+
+    def max_slot(self):
+        """
+        The largest slot number in use, or -1 if there are none.
+        """
+        if self._max >= 0 or not self._list:
+            return self._max
+        return len(self._list) - 1
+
+    def __contains__(self, key):
+        l = self._list
+        if l is not None and type(key) in _SLOT_TYPES and 0 <= key < len(l):
+            return l[key] is not _EMPTY
+        return key in self._dict
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __len__(self):
+        return self._count + len(self._dict)
+
+    def iteritems(self):
+        if self._list is not None:
+            for key, value in enumerate(self._list):
+                if value is not _EMPTY:
+                    yield key, value
+        d = self._dict
+        for key in sorted(d):
+            yield key, d[key]
+
+    def __iter__(self):
+        for key, _ in self.iteritems():
+            yield key
+
+    def itervalues(self):
+        for _, value in self.iteritems():
+            yield value
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return list(self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
+    def __getstate__(self):
+        # The list's empty slots are marked with an object that would not
+        # survive pickling, so pickle the slots themselves.
+        return self.items()
+
+    def __setstate__(self, state):
+        self.__init__()
+        for key, value in state:
+            self[key] = value
+
+    def __repr__(self):
+        return 'SlotMap(%s)' % dict(self.iteritems())
@@ -0,0 +1,45 @@
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+# Measure how much memory common objects take, as the growth in the maximum
+# resident set size while creating many of them. This is how the effect of
+# changes to the representation of objects and caps is checked.
+
+# Add the root directory of this repository to your PYTHONPATH environment
+# variable to enable the following import.
+import capdl
+import resource
+
+def max_rss():
+    # In kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+# Frames, each with a cap to it, including their names and the list holding
+# them.
+N = 200000
+before = max_rss()
+objs = []
+for i in xrange(N):
+    f = capdl.Frame('frame_%d' % i)
+    objs.append((f, capdl.Cap(f, True, False, True)))
+print 'bytes per frame+cap: %d' % ((max_rss() - before) / N)
+
+# Full page tables, with every slot holding the same cap so that only the
+# tables themselves are measured.
+N = 2000
+cap = capdl.Cap(capdl.Frame('frame'))
+before = max_rss()
+tables = []
+for i in xrange(N):
+    pt = capdl.PageTable('pt_%d' % i)
+    for slot in xrange(256):
+        pt[slot] = cap
+    tables.append(pt)
+print 'bytes per full page table: %d' % ((max_rss() - before) / N)
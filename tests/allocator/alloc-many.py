@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+import capdl
+from capdl.Allocator import seL4_IA32_IOPort, seL4_ARM_LargePageObject
+
+# Bulk allocation is equivalent to allocating in a loop.
+one = capdl.ObjectAllocator()
+for i in range(10):
+    one.alloc(capdl.seL4_EndpointObject, label='a')
+many = capdl.ObjectAllocator()
+eps = many.alloc_many(capdl.seL4_EndpointObject, 10, label='a')
+assert [x.name for x in eps] == [x.name for x in one.spec]
+assert many.counter == one.counter == 10
+assert list(many.spec.by_label('a')) == eps
+assert many.labels['a'] == set(eps)
+assert many.name_to_object == dict((x.name, x) for x in eps)
+
+# Names may be given by a format, and extra arguments are passed on.
+frames = many.alloc_many(seL4_ARM_LargePageObject, 4, 'frame%d', 'b',
+    paddr=0x1000)
+assert [x.name for x in frames] == ['frame0', 'frame1', 'frame2', 'frame3']
+assert all(x.size == 64 * 1024 and x.paddr == 0x1000 for x in frames)
+assert list(many.spec.of_type(capdl.Frame)) == frames
+assert many.spec.label_of(frames[0]) == 'b'
+
+# Existing objects are returned rather than recreated.
+again = many.alloc_many(seL4_ARM_LargePageObject, 5, 'frame%d', 'b')
+assert again[:4] == frames
+assert again[4].name == 'frame4' and again[4].paddr == 0
+assert len(many.spec) == 15
+
+# There is only ever one IOPorts object.
+ports = many.alloc_many(seL4_IA32_IOPort, 3, 'ports%d', 'c')
+assert ports[0] is ports[1] is ports[2]
+assert list(many.spec.of_type(capdl.IOPorts)) == [ports[0]]
+assert many.alloc(seL4_IA32_IOPort, 'ports9') is ports[0]
+
+# New types of object may be registered.
+class Widget(capdl.Endpoint):
+    pass
+capdl.register_object_type('widget',
+    lambda allocator, name, **kwargs: Widget(name))
+w = many.alloc('widget', 'w0')
+assert isinstance(w, Widget)
+assert many.alloc_many('widget', 2, 'w%d')[0] is w
+
+failed = False
+try:
+    many.alloc('gadget')
+except Exception:
+    failed = True
+assert failed
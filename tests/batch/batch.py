@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+import capdl
+from capdl import Batch
+import subprocess, sys
+
+elfs = [('../arm-elf/hello.bin', 'first'), ('../arm-elf/hello.bin', 'second'),
+    ('../arm-elf/hello.bin', 'third')]
+
+parallel = Batch.get_spec(elfs, processes=3)
+serial = Batch.get_spec(elfs, processes=1)
+assert str(parallel) == str(serial)
+
+# Each ELF file's objects are labelled with its name.
+expected = capdl.ELF('../arm-elf/hello.bin', 'second').get_spec()
+assert sorted(x.name for x in parallel.by_label('second')) == \
+    sorted(x.name for x in expected)
+assert isinstance(parallel['tcb_first'], capdl.TCB)
+
+# Names must not clash.
+try:
+    Batch.get_spec([('../arm-elf/hello.bin', 'x'), ('../arm-elf/hello.bin', 'x')])
+    clashed = False
+except Exception:
+    clashed = True
+assert clashed, 'merging clashing specs succeeded'
+
+output = subprocess.check_output([sys.executable, '-m', 'capdl.Batch',
+    '-j', '2'] + ['%s=%s' % x for x in elfs])
+assert output == str(serial) + '\n'
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+import capdl
+from capdl import Binary
+import os, tempfile
+
+allocator = capdl.ObjectAllocator()
+cnode = allocator.alloc(capdl.seL4_CapTableObject, 'cnode', 'a')
+cspace = capdl.CSpaceAllocator(cnode)
+ep = allocator.alloc(capdl.seL4_EndpointObject, 'ep', 'a')
+aep = allocator.alloc(capdl.seL4_AsyncEndpointObject, 'aep', 'b')
+ports = allocator.alloc(capdl.Allocator.seL4_IA32_IOPort, 'ports')
+frame = allocator.alloc(capdl.seL4_FrameObject, 'frame', 'b', paddr=0x40000000)
+tcb = allocator.alloc(capdl.seL4_TCBObject, 'tcb', 'a')
+tcb.init = [1, 2, 3]
+tcb.domain = 2
+tcb['cspace'] = capdl.Cap(cnode)
+tcb['cspace'].set_guard(3)
+tcb['cspace'].set_guard_size(4)
+cap = capdl.Cap(ep, read=True, write=True)
+cap.set_badge(42)
+assert cspace.alloc(None) == 1
+cnode[2] = cap
+cnode[7] = capdl.Cap(ports)
+cnode[7].set_ports(range(0x60, 0x65))
+cnode[8] = capdl.Cap(frame, read=True)
+cnode[8].set_cached(False)
+allocator.alloc(capdl.Allocator.seL4_IRQControl, 'irq', number=9, aep=aep)
+allocator.merge(capdl.ELF('../arm-elf/hello.bin', 'hello').get_spec(), 'elf')
+spec = allocator.spec
+
+data = Binary.dumps(spec)
+copy = Binary.loads(data)
+assert str(copy) == str(spec)
+assert list(copy.by_label('elf')) and \
+    [x.name for x in copy.by_label('elf')] == \
+    [x.name for x in spec.by_label('elf')]
+
+# Lazily decode from a file.
+fd, path = tempfile.mkstemp()
+os.close(fd)
+try:
+    Binary.save(spec, path)
+    image = capdl.SpecImage(path)
+    assert len(image) == len(spec)
+    assert 'tcb' in image and 'nothing' not in image
+    t = image.get('tcb')
+    assert t.init == [1, 2, 3] and t.domain == 2
+    assert t['cspace'].guard == 3 and t['cspace'].guard_size == 4
+    c = t['cspace'].referent
+    assert 1 in c and c[1] is None
+    assert c[2].badge == 42 and c[2].read and c[2].write and not c[2].grant
+    assert c[7].ports == range(0x60, 0x65)
+    assert not c[8].cached and c[8].referent.paddr == 0x40000000
+    assert image.get('irq').number == 9
+    assert image.get('nothing') is None
+finally:
+    os.remove(path)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+import capdl
+from capdl.Cache import SpecCache
+import os, shutil, tempfile
+
+directory = tempfile.mkdtemp()
+try:
+    cache = SpecCache(directory)
+    expected = str(capdl.ELF('../arm-elf/hello.bin', 'hello').get_spec())
+
+    assert str(cache.get_spec('../arm-elf/hello.bin', 'hello')) == expected
+    assert cache.stats()['misses'] == 1 and cache.stats()['hits'] == 0
+    assert str(cache.get_spec('../arm-elf/hello.bin', 'hello')) == expected
+    assert cache.stats()['hits'] == 1
+
+    # A different name or set of arguments is a different entry.
+    cache.get_spec('../arm-elf/hello.bin', 'other')
+    cache.get_spec('../arm-elf/hello.bin', 'hello', infer_tcb=False)
+    assert cache.stats()['misses'] == 3
+
+    pages = capdl.ELF('../ia32-elf/hello.bin', 'hello').get_pages()
+    cache.get_pages('../ia32-elf/hello.bin', 'hello')
+    cached = cache.get_pages('../ia32-elf/hello.bin', 'hello')
+    assert cache.stats()['hits'] == 2
+    assert cached.arch == pages.arch and cached.name == pages.name
+    assert list(cached.extents()) == list(pages.extents())
+
+    # Entries are evicted to stay within the size bound, least recently used
+    # first.
+    # first. The entry just written is kept, as are files that are not
+    # entries, such as another process's entry still being written.
+    in_flight = tempfile.mkstemp(suffix='.tmp', dir=directory)
+    os.close(in_flight[0])
+    cache = SpecCache(directory, max_size=1)
+    cache.get_spec('../arm-elf/hello.bin', 'hello')
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['evictions'] == 0
+    cache.get_spec('../ia32-elf/hello.bin', 'hello')
+    assert cache.stats()['evictions'] == 4
+    assert sorted(os.listdir(directory)) == \
+        sorted([os.path.basename(in_flight[1]),
+            os.path.basename(cache._entry('../ia32-elf/hello.bin', 'spec',
+                'hello', True, True))])
+    cache.get_spec('../ia32-elf/hello.bin', 'hello')
+    assert cache.stats()['hits'] == 2
+
+    # Losing a race with another process evicting an entry just after it
+    # was read is not an error.
+    def evicted(path, times):
+        raise OSError(2, 'No such file or directory', path)
+    utime = os.utime
+    os.utime = evicted
+    try:
+        assert str(cache.get_spec('../ia32-elf/hello.bin', 'hello')) == \
+            str(capdl.ELF('../ia32-elf/hello.bin', 'hello').get_spec())
+    finally:
+        os.utime = utime
+    assert cache.stats()['hits'] == 3
+finally:
+    shutil.rmtree(directory)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+
+import capdl
+from capdl import Binary, CapGraph
+import os, tempfile
+
+spec = capdl.Spec()
+ep = capdl.Endpoint('ep')
+other = capdl.Endpoint('other')
+shared = capdl.CNode('shared', 3)
+shared[0] = capdl.Cap(ep, write=True)
+shared[0].set_badge(5)
+receiver = capdl.CNode('receiver', 2)
+receiver[0] = capdl.Cap(ep, read=True)
+receiver[1] = capdl.Cap(other, write=True)
+sender = capdl.CNode('sender', 2)
+sender[3] = capdl.Cap(shared)
+a = capdl.TCB('a')
+a['cspace'] = capdl.Cap(sender)
+b = capdl.TCB('b')
+b['cspace'] = capdl.Cap(receiver)
+frame = capdl.Frame('frame')
+b['ipc_buffer_slot'] = capdl.Cap(frame, read=True, write=True)
+for obj in [ep, other, shared, receiver, sender, a, b, frame]:
+    spec.add_object(obj)
+# Referenced, but not part of the spec.
+receiver[2] = capdl.Cap(capdl.AsyncEndpoint('outside'), read=True)
+
+def check(graph):
+    # Objects are numbered as in the binary encoding.
+    image = Binary.SpecImage(Binary.dumps(spec))
+    for name in ['ep', 'shared', 'a', 'b', 'frame', 'outside']:
+        assert graph.index(spec.by_name(name) or receiver[2].referent) == \
+            image.index(name)
+    n = graph.index
+    assert list(graph.types) == [Binary.TYPE_CODES[type(o)]
+        for o in graph.objects]
+    assert len(graph.offsets) == len(graph.types) + 1
+    assert len(graph.targets) == graph.offsets[-1] == 8
+    edges = range(graph.offsets[n(shared)], graph.offsets[n(shared) + 1])
+    assert [graph.targets[e] for e in edges] == [n(ep)]
+    assert [graph.rights[e] for e in edges] == [Binary.CAP_WRITE]
+    assert [graph.badges[e] for e in edges] == [5]
+    assert graph.badges[graph.offsets[n(receiver)]] == Binary.NONE_INDEX
+
+    assert graph.holders(n(ep)) == [n(shared), n(receiver)]
+    assert graph.holders(n(ep), Binary.CAP_WRITE) == [n(shared)]
+    assert graph.senders(n(ep)) == [n(a)]
+    assert graph.senders(n(other)) == [n(b)]
+    assert graph.reachable([n(a)]) == sorted([n(a), n(sender), n(shared),
+        n(ep)])
+    assert graph.reachable([n(ep)], reverse=True) == sorted([n(ep),
+        n(shared), n(receiver), n(sender), n(a), n(b)])
+
+    # Saving and loading gives the same columns.
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        CapGraph.save(graph, path)
+        loaded = CapGraph.load(path)
+        for column in ['types', 'offsets', 'targets', 'rights', 'badges']:
+            assert list(getattr(loaded, column)) == \
+                list(getattr(graph, column))
+        assert loaded.senders(n(ep)) == [n(a)]
+        assert loaded.reachable([n(b)]) == graph.reachable([n(b)])
+    finally:
+        os.remove(path)
+
+check(spec.cap_graph())
+
+# The fallback without NumPy answers the same.
+numpy = CapGraph.numpy
+CapGraph.numpy = None
+try:
+    check(spec.cap_graph())
+finally:
+    CapGraph.numpy = numpy
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+import capdl
+
+frame = capdl.Frame('frame')
+cap = capdl.Cap(frame, read=True, grant=True)
+assert cap.read and not cap.write and cap.grant and cap.cached
+cap.write = True
+cap.read = False
+assert not cap.read and cap.write and cap.grant
+cap.set_cached(False)
+assert not cap.cached
+assert repr(cap) == 'frame (WX, uncached)'
+
+# Attributes that only some caps have default sensibly.
+assert cap.badge is None and cap.guard == 0 and cap.ports is None
+cnode = capdl.CNode('cnode', 4)
+cnode_cap = capdl.Cap(cnode)
+cnode_cap.set_guard(3)
+cnode_cap.set_guard_size(24)
+assert cnode_cap.guard == 3 and cnode_cap.guard_size == 24
+assert repr(cnode_cap) == 'cnode (guard: 3, guard_size: 24)'
+ep_cap = capdl.Cap(capdl.Endpoint('ep'), read=True)
+ep_cap.set_badge(0)
+assert ep_cap.badge == 0
+assert repr(ep_cap) == 'ep (R, badge: 0)'
+
+# Neither objects nor caps carry a per-instance dictionary.
+tcb = capdl.TCB('tcb', ip=0x1000)
+for x in [frame, cap, cnode, tcb, capdl.Untyped('ut'),
+          capdl.IOPageTable('io_pt', 2)]:
+    assert not hasattr(x, '__dict__'), x
+assert repr(tcb).startswith('tcb = tcb (addr: 0x00000000, ip: 0x00001000')
+assert repr(capdl.Untyped('ut', 14)) == 'ut = ut (14 bits)'
+assert repr(capdl.IOPageTable('io_pt', 2)) == 'io_pt = io_pt (level: 2)'
+
+# Caps with the same attributes share them, and setting an attribute of one
+# cap leaves the others alone.
+a = capdl.Cap(frame, read=True)
+b = capdl.Cap(capdl.Frame('other'), read=True)
+assert a._attrs is b._attrs
+b.set_cached(False)
+assert a.cached and not b.cached
+c = capdl.Cap(capdl.Frame('another'), read=True)
+c.cached = False
+assert b._attrs is c._attrs
+ports_cap = capdl.Cap(capdl.IOPorts('ports'))
+ports_cap.set_ports(range(4, 8))
+assert ports_cap.ports == [4, 5, 6, 7]
+ports_cap.ports.append(8)
+assert ports_cap.ports == [4, 5, 6, 7]
+
+# Caps with other attributes set do not share them, so nothing outlives the
+# caps using it, and clearing the attributes shares them again.
+d = capdl.Cap(capdl.Endpoint('ep'), read=True)
+e = capdl.Cap(capdl.Endpoint('ep'), read=True)
+d.set_badge(5)
+e.set_badge(5)
+assert d._attrs == e._attrs and d._attrs is not e._attrs
+d.badge = None
+assert d._attrs is a._attrs
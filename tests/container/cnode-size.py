@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+import capdl
+import math
+
+def expected_size(slots):
+    return int(math.floor(math.log(reduce(max, slots, 4), 2)) + 1)
+
+ep = capdl.Endpoint('ep')
+cnode = capdl.CNode('cnode')
+slots = set()
+assert repr(cnode) == 'cnode = cnode (3 bits)'
+
+# The size follows the largest slot as slots are filled and emptied, both
+# densely and sparsely.
+for slot in [0, 1, 2, 3, 7, 6, 4, 5, 300, 17, 2000, 8]:
+    cnode[slot] = capdl.Cap(ep)
+    slots.add(slot)
+    assert capdl.Object.calculate_size(cnode) == expected_size(slots)
+for slot in [2000, 300, 0, 7, 17, 6, 5, 8, 4, 3, 2, 1]:
+    del cnode[slot]
+    slots.remove(slot)
+    assert capdl.Object.calculate_size(cnode) == expected_size(slots)
+assert cnode.slots.max_slot() == -1
+
+for slot in range(40):
+    cnode[slot] = capdl.Cap(ep)
+del cnode[39]
+del cnode[38]
+assert cnode.slots.max_slot() == 37
+assert repr(cnode) == 'cnode = cnode (6 bits)'
+
+# Usage shows how far a CNode could shrink.
+big = capdl.CNode('big', 12)
+for slot in range(1, 11):
+    big[slot] = capdl.Cap(ep)
+assert big.usage() == {
+    'occupied':10,
+    'high_water':11,
+    'wasted':4086,
+    'min_size_bits':4,
+}
+cnode.finalise_size()
+assert cnode.size_bits == 6
+assert cnode.usage()['wasted'] == 64 - 38
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+import capdl
+
+frames = [capdl.Frame('frame%d' % i) for i in range(256)]
+
+# A full page table is kept in a list and iterated in slot order.
+pt = capdl.PageTable('pt')
+for i in reversed(range(256)):
+    pt[i] = capdl.Cap(frames[i])
+assert pt.slots._list is not None and not pt.slots._dict
+assert list(pt) == range(256)
+assert [cap.referent for cap in pt.slots.values()] == frames
+assert 255 in pt and 256 not in pt
+assert len(pt.slots) == 256
+
+# Emptying most of it moves what is left back to a dictionary.
+for i in range(200):
+    del pt[i]
+assert pt.slots._list is None
+assert list(pt) == range(200, 256)
+assert pt[200].referent is frames[200]
+try:
+    pt[0]
+    assert False, 'lookup of an empty slot succeeded'
+except KeyError:
+    pass
+
+# A sparse page directory stays in a dictionary, and mixes with named slots.
+pd = capdl.PageDirectory('pd')
+pd[4000] = capdl.Cap(frames[0])
+pd[7] = capdl.Cap(frames[1])
+pd[7] = capdl.Cap(frames[2])
+assert pd.slots._list is None
+assert list(pd) == [7, 4000]
+tcb = capdl.TCB('tcb')
+tcb['vspace'] = capdl.Cap(pd)
+tcb['cspace'] = capdl.Cap(capdl.CNode('cnode', 2))
+tcb[0] = capdl.Cap(frames[3])
+assert list(tcb) == [0, 'cspace', 'vspace']
+assert tcb.slots.get('ipc_buffer_slot') is None
+
+# Filling in slots beyond the end of the list keeps them in order.
+cnode = capdl.CNode('cnode', 4)
+for i in [0, 1, 2, 5, 3, 4, 9, 8, 7, 6]:
+    cnode[i] = capdl.Cap(frames[i])
+cnode[6] = None
+assert list(cnode) == range(10)
+assert cnode[6] is None
+assert cnode.print_contents().split('\n')[1:4] == \
+    ['0x0: frame0', '0x1: frame1', '0x2: frame2']
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+import capdl
+from capdl.Allocator import cspace_layout
+
+def resolve(cap, cptr, bits=32):
+    '''
+    Resolve a CPtr the way the kernel does, returning the cap it names.
+    '''
+    while True:
+        cnode = cap.referent
+        assert isinstance(cnode, capdl.CNode)
+        bits -= cap.guard_size
+        assert (cptr >> bits) & ((1 << cap.guard_size) - 1) == cap.guard
+        bits -= cnode.size_bits
+        slot = (cptr >> bits) & ((1 << cnode.size_bits) - 1)
+        cap = cnode[slot]
+        if bits == 0:
+            return cap
+
+# Small CSpaces use a single CNode; large ones are split.
+assert cspace_layout(10) == (0, 4)
+root_bits, leaf_bits = cspace_layout(1 << 16)
+assert root_bits > 0 and root_bits + leaf_bits < 18
+
+allocator = capdl.ObjectAllocator()
+cspace = capdl.MultiLevelCSpaceAllocator('cspace', 5000, allocator, 'a')
+eps = [allocator.alloc(capdl.seL4_EndpointObject) for _ in range(3000)]
+cptrs = [cspace.alloc(ep, read=True) for ep in eps]
+assert len(set(cptrs)) == 3000 and 0 not in cptrs
+assert cspace.alloc(eps[10]) == cptrs[10]
+root = cspace.root_cap()
+for ep, cptr in zip(eps, cptrs):
+    assert resolve(root, cptr).referent is ep
+    assert cspace[cptr].referent is ep
+
+# The CNodes are in the spec, and use less memory than a single CNode big
+# enough for the expected number of slots would.
+assert len(cspace.cnodes) > 2
+assert set(cspace.cnodes) == set(allocator.spec.by_label('a'))
+assert cspace.memory() < (1 << 13) * 16
+
+# Freed CPtrs are reused once the CSpace fills up.
+cspace.free(cptrs[0])
+while cspace.alloc(None) != -1:
+    pass
+cspace.free(cptrs[5])
+ep = allocator.alloc(capdl.seL4_EndpointObject)
+assert cspace.alloc(ep) == cptrs[5]
+assert resolve(root, cptrs[5]).referent is ep
+
+# CNode memory and CPtr width follow the architecture.
+allocator = capdl.ObjectAllocator()
+allocator.spec.arch = 'x86_64'
+wide = capdl.MultiLevelCSpaceAllocator('wide', 5000, allocator)
+assert wide.arch is capdl.get_arch('x86_64')
+assert wide.memory() == sum(1 << (x.size_bits + 5) for x in wide.cnodes)
+narrow = capdl.MultiLevelCSpaceAllocator('narrow', 5000, arch='ia32')
+assert narrow.memory() * 2 == wide.memory()
+assert cspace_layout(1 << 16, 'x86_64') == cspace_layout(1 << 16)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+import capdl
+
+cnode = capdl.CNode('cnode', 3)
+cspace = capdl.CSpaceAllocator(cnode)
+eps = [capdl.Endpoint('ep%d' % i) for i in range(8)]
+
+# Slots populated directly are skipped.
+cnode[2] = capdl.Cap(eps[7])
+assert cspace.alloc(eps[0]) == 1
+assert cspace.alloc(eps[1]) == 3
+assert cspace.alloc(eps[0]) == 1
+
+# Freed slots are reused, lowest first.
+cspace.free(1)
+assert 1 not in cnode
+assert cspace.alloc(eps[2]) == 1
+cspace.reserve(5)
+assert cnode[5] is None
+assert cspace.alloc(eps[3]) == 4
+assert cspace.alloc(eps[4]) == 6
+assert cspace.alloc(eps[5]) == 7
+assert cspace.alloc(eps[6]) == -1
+
+# Slots cleared directly are found once the cursor reaches the end.
+del cnode[3]
+del cnode[4]
+assert cspace.alloc(eps[6]) == 3
+assert cspace.alloc_range(2) == -1
+del cnode[5]
+assert cspace.alloc_range(2) == 4
+assert cnode[4] is None and cnode[5] is None
+
+# Contiguous runs come from beyond the cursor when possible.
+cnode = capdl.CNode('big', 'auto')
+cspace = capdl.CSpaceAllocator(cnode)
+cnode[3] = capdl.Cap(eps[0])
+assert cspace.alloc_range(3) == 4
+assert cspace.alloc(eps[1]) == 1
+assert cspace.alloc(eps[2]) == 2
+assert cspace.alloc(eps[3]) == 7
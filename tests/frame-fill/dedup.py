@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+import capdl
+from capdl.Dedup import deduplicate_frames
+
+def frames(spec):
+    return set(spec.of_type(capdl.Frame))
+
+def writable(spec):
+    return set(cap.referent for pt in spec.of_type(capdl.PageTable)
+        for cap in pt.slots.values() if cap.write)
+
+a = capdl.ELF('../arm-elf/hello.bin', 'a', use_mmap=True).get_spec()
+b = capdl.ELF('../arm-elf/hello.bin', 'b', use_mmap=True).get_spec()
+a_frames, b_frames = frames(a), frames(b)
+before = str(a).count('frame (4k')
+
+report = deduplicate_frames([a, b])
+assert report.frames_saved > 0
+assert report.bytes_saved == report.frames_saved * 4096
+
+# Every read-only frame of b is now shared with a, and writable frames are
+# untouched.
+assert frames(b) - writable(b) <= a_frames
+assert writable(b) <= b_frames and not (writable(b) & a_frames)
+assert len(frames(b) & a_frames) == report.frames_saved
+assert str(a).count('frame (4k') == before
+
+# Merging the two specs creates fewer frames.
+merged = capdl.Spec(a.arch)
+merged.merge(a)
+merged.merge(b)
+assert len(frames(merged)) == len(a_frames) + len(b_frames) - \
+    report.frames_saved
+
+# Frames without known contents are left alone.
+c = capdl.ELF('../arm-elf/hello.bin', 'c').get_spec()
+d = capdl.ELF('../arm-elf/hello.bin', 'd').get_spec()
+assert deduplicate_frames([c, d]).frames_saved == 0
+
+# Caps held outside page tables are redirected too, and a writable one stops
+# the frame being shared.
+a = capdl.ELF('../arm-elf/hello.bin', 'a', use_mmap=True).get_spec()
+b = capdl.ELF('../arm-elf/hello.bin', 'b', use_mmap=True).get_spec()
+read_only = sorted(frames(b) - writable(b), key=lambda f: f.name)
+assert len(read_only) >= 2
+cn = capdl.CNode('cn', 2)
+cn[0] = capdl.Cap(read_only[0], read=True)
+cn[1] = capdl.Cap(read_only[1], read=True, write=True)
+tcb = capdl.TCB('tcb')
+tcb['ipc_buffer_slot'] = capdl.Cap(read_only[0], read=True)
+b.add_object(cn)
+b.add_object(tcb)
+a_frames = frames(a)
+
+report = deduplicate_frames([a, b])
+assert cn[0].referent in a_frames and cn[0].referent in b
+assert tcb['ipc_buffer_slot'].referent is cn[0].referent
+assert read_only[0] not in b
+assert cn[1].referent is read_only[1] and read_only[1] in b
+assert all(cap.referent in b for c in b.containers()
+    for cap in c.slots.itervalues() if cap is not None)
+
+# Rebuilding a deduplicated spec keeps mapping the shared frames, and only
+# maps frames that are in the spec.
+def dangling(spec):
+    return [cap for c in spec.containers() for cap in c.slots.itervalues()
+        if cap is not None and cap.referent not in spec]
+
+a_pages = capdl.ELF('../arm-elf/hello.bin', 'a', use_mmap=True).get_pages()
+b_pages = capdl.ELF('../arm-elf/hello.bin', 'b', use_mmap=True).get_pages()
+a, b = a_pages.get_spec(), b_pages.get_spec()
+report = deduplicate_frames([a, b])
+shared = frames(b) & frames(a)
+assert len(shared) == report.frames_saved
+b_pages.add_page(0x7000, read=True, write=True)
+assert b_pages.get_spec() is b
+assert not dangling(b)
+assert frames(b) & frames(a) == shared
+
+# A shared frame that becomes writable is replaced rather than written.
+vaddr = min(base for base, _, _, write, _ in b_pages.extents() if not write)
+b_pages.add_page(vaddr, read=True, write=True)
+b_pages.get_spec()
+assert not dangling(b)
+assert writable(b) & frames(a) == set()
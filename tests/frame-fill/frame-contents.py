@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+import capdl
+from elftools.elf.elffile import ELFFile
+
+def contents(frame):
+    data = bytearray(frame.size)
+    for f in frame.fill:
+        data[f.dest_offset:f.dest_offset + f.length] = f.data()
+    return str(data)
+
+# Build the expected memory image by reading each segment conventionally.
+image = {}
+with open('../arm-elf/hello.bin', 'rb') as f:
+    for seg in ELFFile(f).iter_segments():
+        if seg['p_type'] != 'PT_LOAD':
+            continue
+        data = seg.data() + '\0' * (seg['p_memsz'] - seg['p_filesz'])
+        for i, byte in enumerate(data):
+            image[seg['p_vaddr'] + i] = byte
+
+elf = capdl.ELF('../arm-elf/hello.bin', 'hello', use_mmap=True)
+pages = elf.get_pages()
+spec = pages.get_spec()
+pd = pages.get_page_directory()[0]
+checked = 0
+for vaddr in pages:
+    pt = pd[capdl.page_table_index('arm', vaddr)].referent
+    frame = pt[capdl.page_index('arm', vaddr)].referent
+    expected = ''.join(image.get(vaddr + i, '\0') for i in range(frame.size))
+    assert contents(frame) == expected
+    checked += 1
+assert checked == len(pages)
+
+# Without mmap, contents are not tracked.
+spec = capdl.ELF('../arm-elf/hello.bin', 'hello').get_spec()
+assert all(x.fill is None for x in spec.of_type(capdl.Frame))
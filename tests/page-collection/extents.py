@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+import capdl
+from capdl import PageCollection
+
+pages = PageCollection()
+pages.add_pages(0x10000, 0x20000, read=True)
+pages.add_page(0x14000, write=True)
+pages.add_pages(0x1f000, 0x22001, execute=True)
+pages.add_page(0x30000)
+
+# Per-page view.
+assert len(pages) == 16 + 3 + 1
+assert pages[0x10000] == {'read':True, 'write':False, 'execute':False}
+assert pages[0x14000] == {'read':True, 'write':True, 'execute':False}
+assert pages[0x1f000] == {'read':True, 'write':False, 'execute':True}
+assert pages[0x22000] == {'read':False, 'write':False, 'execute':True}
+assert pages[0x30000] == {'read':False, 'write':False, 'execute':False}
+assert 0x23000 not in pages
+try:
+    pages[0x23000]
+    assert False, 'lookup of a missing page succeeded'
+except KeyError:
+    pass
+assert list(pages) == range(0x10000, 0x23000, 0x1000) + [0x30000]
+
+# Upgrades split runs and identical neighbours are coalesced.
+assert list(pages.extents()) == [
+    (0x10000, 0x14000, True, False, False),
+    (0x14000, 0x15000, True, True, False),
+    (0x15000, 0x1f000, True, False, False),
+    (0x1f000, 0x20000, True, False, True),
+    (0x20000, 0x23000, False, False, True),
+    (0x30000, 0x31000, False, False, False),
+]
+pages.add_page(0x14000, read=True)
+pages.add_pages(0x15000, 0x16000, write=True)
+assert list(pages.extents())[1] == (0x14000, 0x16000, True, True, False)
+
+# Every page gets a frame.
+spec = pages.get_spec()
+assert len([x for x in spec if isinstance(x, capdl.Frame)]) == len(pages)
+
+# Changing the per-page view changes the page, including taking permissions
+# away, and the spec follows.
+for use_numpy in [False, True]:
+    pages = PageCollection('p', use_numpy=use_numpy)
+    pages.add_pages(0x10000, 0x13000, read=True, write=True)
+    spec = pages.get_spec()
+    pages[0x11000]['write'] = False
+    pages[0x12000].update(execute=True)
+    assert pages[0x11000] == {'read':True, 'write':False, 'execute':False}
+    assert list(pages.extents()) == [
+        (0x10000, 0x11000, True, True, False),
+        (0x11000, 0x12000, True, False, False),
+        (0x12000, 0x13000, True, True, True),
+    ]
+    pt = pages.get_spec()['pt_p_0']
+    assert not pt[0x11].write and pt[0x12].grant and pt[0x10].write
+    try:
+        pages[0x10000]['dirty'] = True
+        assert False, 'set an unknown permission'
+    except KeyError:
+        pass
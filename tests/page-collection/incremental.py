@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+import capdl
+
+def mappings(pages, spec):
+    '''
+    Everything mapped by a page collection's spec, as a dictionary from
+    virtual address to (size, read, write, execute).
+    '''
+    result = {}
+    pd = pages.get_page_directory()[0]
+    assert pd in spec
+    for pd_index, cap in pd.slots.iteritems():
+        if isinstance(cap.referent, capdl.PageTable):
+            assert cap.referent in spec
+            for pt_index, page_cap in cap.referent.slots.iteritems():
+                vaddr = pd_index * 1024 * 1024 + pt_index * 4096
+                result[vaddr] = page_cap
+        else:
+            result[pd_index * 1024 * 1024] = cap
+    for vaddr, cap in result.items():
+        assert cap.referent in spec
+        result[vaddr] = (cap.referent.size, cap.read, cap.write, cap.grant)
+    return result
+
+def fresh(pages, large_pages=False):
+    copy = capdl.PageCollection(pages.name, pages.arch)
+    for base, limit, read, write, execute in pages.extents():
+        copy.add_pages(base, limit, read, write, execute)
+    return mappings(copy, copy.get_spec(large_pages))
+
+pages = capdl.PageCollection('inc', 'arm11')
+pages.add_pages(0x10000, 0x20000, read=True, execute=True)
+pages.add_pages(0x300000, 0x301000, read=True, write=True)
+spec = pages.get_spec()
+frames = set(spec.of_type(capdl.Frame))
+assert len(frames) == 17
+
+# Adding pages updates the same spec, rebuilding only the regions touched.
+del spec
+pages.add_pages(0x302000, 0x304000, read=True, write=True)
+spec = pages.get_spec()
+assert pages.get_spec() is spec
+new = set(spec.of_type(capdl.Frame))
+assert len(new) == 19
+assert frames <= new
+assert mappings(pages, spec) == fresh(pages)
+assert len(list(spec.of_type(capdl.PageTable))) == 2
+
+pages.add_page(0x10000, write=True)
+pages.add_pages(0x500000, 0x501000, read=True)
+spec = pages.get_spec()
+assert mappings(pages, spec) == fresh(pages)
+assert len(list(spec.of_type(capdl.PageTable))) == 3
+assert len(set(spec.of_type(capdl.Frame))) == 20
+names = [x.name for x in spec]
+assert len(names) == len(set(names))
+
+# Frames whose pages did not change are kept, so caps to them from
+# elsewhere stay valid, and mappings are only replaced where the rights
+# changed.
+pages = capdl.PageCollection('c', 'arm11')
+pages.add_pages(0x10000, 0x12000, read=True)
+spec = pages.get_spec()
+pt = spec['pt_c_0']
+first, second = pt[0x10], pt[0x11]
+tcb = capdl.TCB('tcb')
+tcb['ipc_buffer_slot'] = capdl.Cap(first.referent, read=True)
+pages.add_page(0x20000, read=True)
+pages.add_page(0x11000, read=True, write=True)
+assert pages.get_spec() is spec
+assert tcb['ipc_buffer_slot'].referent in spec
+assert spec['frame_c_0'] is first.referent
+assert pt[0x10] is first
+assert pt[0x11] is not second and pt[0x11].referent is second.referent
+assert pt[0x11].write
+assert spec['frame_c_2'] is pt[0x20].referent
+assert mappings(pages, spec) == fresh(pages)
+
+# Switching to large pages starts again.
+pages.add_pages(0x1000000, 0x1200000, read=True)
+large = pages.get_spec(large_pages=True)
+assert large is not spec
+assert mappings(pages, large) == fresh(pages, True)
+pages.add_pages(0x1200000, 0x1300000, read=True)
+assert pages.get_spec(large_pages=True) is large
+assert mappings(pages, large) == fresh(pages, True)
+sections = [x for x in large.of_type(capdl.Frame) if x.size == 1024 * 1024]
+assert len(sections) == 3
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+import capdl
+
+def frames(spec):
+    return sorted(x.size for x in spec if isinstance(x, capdl.Frame))
+
+# A 16M supersection, a 1M section, a 64K large page and two 4K pages, all
+# read-write, followed by a read-only 64K region that is not 64K aligned.
+pages = capdl.PageCollection('arm', 'arm11')
+pages.add_pages(0x01000000, 0x02000000 + 0x100000 + 0x10000 + 0x2000,
+    read=True, write=True)
+pages.add_pages(0x03001000, 0x03011000, read=True)
+
+spec = pages.get_spec(large_pages=True)
+assert frames(spec) == [4096] * 2 + [4096] * 16 + [64 * 1024] + \
+    [1024 * 1024] + [16 * 1024 * 1024]
+pd = pages.get_page_directory()[0]
+assert pd[0x10].referent.size == 16 * 1024 * 1024
+assert pd[0x20].referent.size == 1024 * 1024
+assert isinstance(pd[0x21].referent, capdl.PageTable)
+assert pd[0x21].referent[0].referent.size == 64 * 1024
+assert 'frame (16M)' in str(spec)
+assert 'frame (64k)' in str(spec)
+# Two page tables, for 0x02100000 and 0x03000000.
+assert len([x for x in spec if isinstance(x, capdl.PageTable)]) == 2
+
+# Without promotion every page gets its own frame.
+spec = pages.get_spec()
+assert frames(spec) == [4096] * len(pages)
+assert isinstance(pd[0x11].referent, capdl.PageTable)
+
+# IA32 uses 4M pages in the page directory.
+pages = capdl.PageCollection('x86', 'ia32')
+pages.add_pages(0x00400000, 0x00c00000, read=True)
+spec = pages.get_spec(large_pages=True)
+assert frames(spec) == [4 * 1024 * 1024] * 2
+assert not [x for x in spec if isinstance(x, capdl.PageTable)]
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+import capdl
+import capdl.Binary, capdl.Parser
+from capdl.Planner import object_size_bits
+
+# The descriptors agree with the two level helpers.
+for arch in ['arm11', 'ia32']:
+    for vaddr in [0, 0x1000, 0x123456, 0x7ffff000, 0xfffff000]:
+        a = capdl.get_arch(arch)
+        assert capdl.page_index(arch, vaddr) == vaddr % \
+            a.page_table.coverage / 4096
+        assert capdl.page_table_index(arch, vaddr) == \
+            vaddr / a.page_table.coverage
+assert capdl.get_arch('ARM') is capdl.get_arch('arm11')
+assert capdl.get_arch('x64').name == 'x86_64'
+
+def walk(table, levels, vaddr=0, depth=0):
+    '''
+    Map each virtual address mapped under a table to its frame and the depth
+    at which it is mapped.
+    '''
+    result = {}
+    level = levels[depth]
+    for index, cap in table.slots.iteritems():
+        v = vaddr + (index << level.shift)
+        if isinstance(cap.referent, capdl.Frame):
+            result[v] = (cap.referent, depth)
+        else:
+            result.update(walk(cap.referent, levels, v, depth + 1))
+    return result
+
+for arch, root, middle in [('x86_64', capdl.PML4, capdl.PDPT),
+                           ('aarch64', capdl.PGD, capdl.PUD)]:
+    levels = capdl.get_arch(arch).levels
+    pages = capdl.PageCollection('test', arch)
+    pages.add_pages(0x400000, 0x403000, read=True, execute=True)
+    pages.add_pages(0x7fff00000000, 0x7fff00001000, read=True, write=True)
+    pages.add_pages(0x80000000, 0x80400000, read=True)
+    spec = pages.get_spec()
+    pd = pages.get_page_directory()[0]
+    assert isinstance(pd, root) and pd.name == '%s_test' % levels[0].kind
+    assert len(list(spec.of_type(middle))) == 2
+    assert len(list(spec.of_type(capdl.PageDirectory))) == 3
+    assert len(list(spec.of_type(capdl.PageTable))) == 4
+    mapped = walk(pd, levels)
+    assert sorted(mapped) == sorted(pages)
+    assert all(depth == 3 for _, depth in mapped.values())
+
+    # Large pages are mapped into page directories, and the spec is updated
+    # in place as pages are added.
+    large = pages.get_spec(large_pages=True)
+    mapped = walk(pd, levels)
+    assert mapped[0x80000000][0].size == 2 * 1024 * 1024
+    assert mapped[0x80000000][1] == 2
+    assert len(list(large.of_type(capdl.PageTable))) == 2
+    pages.add_pages(0x7fff00200000, 0x7fff00201000, read=True)
+    assert pages.get_spec(large_pages=True) is large
+    mapped = walk(pd, levels)
+    assert 0x7fff00200000 in mapped
+    frames = set(x for x, _ in mapped.values())
+    assert frames == set(large.of_type(capdl.Frame))
+
+    # The new tables survive the binary and text encodings.
+    copy = capdl.Binary.loads(capdl.Binary.dumps(large))
+    assert str(copy) == str(large)
+    assert str(capdl.Parser.parse(str(large).split('\n'))) == str(large)
+
+    assert object_size_bits(arch, pd) == 12
+    assert object_size_bits(arch, capdl.CNode('cnode', 4)) == 9
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+import capdl
+import random, sys
+
+try:
+    import numpy
+except ImportError:
+    # Nothing to test; page collections fall back to extents.
+    sys.exit(0)
+
+# The NumPy backend behaves exactly as extents do.
+random.seed(0)
+for arch in ['arm11', 'ia32', 'x86_64']:
+    plain = capdl.PageCollection('p', arch)
+    windows = capdl.PageCollection('p', arch, use_numpy=True)
+    assert windows._extents.__class__.__name__ == '_Windows'
+    for _ in range(300):
+        base = random.randrange(0, 0x3000) * 4096
+        limit = base + random.choice([1, 2, 17, 300, 1500]) * 4096
+        perms = [random.random() < 0.5 for _ in range(3)]
+        if random.random() < 0.3:
+            plain.add_page(base, *perms)
+            windows.add_page(base, *perms)
+        else:
+            plain.add_pages(base, limit, *perms)
+            windows.add_pages(base, limit, *perms)
+    assert list(windows.extents()) == list(plain.extents())
+    assert len(windows) == len(plain)
+    for _ in range(1000):
+        vaddr = random.randrange(0, 0x3600) * 4096
+        assert (vaddr in windows) == (vaddr in plain)
+        if vaddr in plain:
+            assert windows[vaddr] == plain[vaddr]
+    assert str(windows.get_spec()) == str(plain.get_spec())
+    assert str(windows.get_spec(True)) == str(plain.get_spec(True))
+
+# Pages without permissions are still present.
+windows = capdl.PageCollection('p', use_numpy=True)
+windows.add_page(0x1000)
+assert 0x1000 in windows and 0x2000 not in windows
+assert list(windows.extents()) == [(0x1000, 0x2000, False, False, False)]
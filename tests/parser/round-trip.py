@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+import capdl
+from capdl import Parser
+from StringIO import StringIO
+
+allocator = capdl.ObjectAllocator()
+cnode = allocator.alloc(capdl.seL4_CapTableObject, 'cnode', size_bits=4)
+ep = allocator.alloc(capdl.seL4_EndpointObject, 'ep')
+aep = allocator.alloc(capdl.seL4_AsyncEndpointObject, 'aep')
+ports = allocator.alloc(capdl.Allocator.seL4_IA32_IOPort, 'ports')
+frame = allocator.alloc(capdl.seL4_FrameObject, 'frame', paddr=0x40000000)
+section = allocator.alloc(capdl.Allocator.seL4_ARM_SectionObject, 'section')
+allocator.alloc(capdl.seL4_UntypedObject, 'ut', size_bits=20)
+allocator.alloc(capdl.Allocator.seL4_IA32_IOSpace, 'dev', domainID=1, bus=2,
+    dev=3, fun=4)
+allocator.alloc(capdl.seL4_IA32_IOPageTableObject, 'iopt')
+tcb = allocator.alloc(capdl.seL4_TCBObject, 'tcb')
+tcb.ip = 0x8000
+tcb.init = [1, 0xcafe]
+tcb.domain = 2
+tcb['cspace'] = capdl.Cap(cnode)
+tcb['cspace'].set_guard(3)
+tcb['cspace'].set_guard_size(4)
+cap = capdl.Cap(ep, read=True, grant=True)
+cap.set_badge(42)
+cnode[2] = cap
+cnode[3] = capdl.Cap(ports)
+cnode[3].set_ports(range(0x60, 0x65))
+cnode[4] = capdl.Cap(frame, read=True, write=True)
+cnode[4].set_cached(False)
+cnode[5] = capdl.Cap(section)
+allocator.alloc(capdl.Allocator.seL4_IRQControl, 'irq', number=9, aep=aep)
+allocator.merge(capdl.ELF('../arm-elf/hello.bin', 'hello').get_spec())
+spec = allocator.spec
+
+text = str(spec)
+parsed = Parser.parse(StringIO(text))
+assert str(parsed) == text
+assert parsed['tcb']['cspace'].referent is parsed['cnode']
+assert parsed['cnode'][2].badge == 42
+assert parsed['irq'].number == 9
+
+# Errors carry the line number.
+try:
+    Parser.parse(['arch arm11', 'objects {', 'x = nonsense', '}'])
+    assert False, 'parsing an unknown object type succeeded'
+except ValueError as e:
+    assert str(e).startswith('line 3:')
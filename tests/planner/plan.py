@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+import capdl
+from capdl.Planner import object_size_bits, plan
+
+assert object_size_bits('arm11', capdl.TCB('tcb')) == 9
+assert object_size_bits('ia32', capdl.TCB('tcb')) == 10
+assert object_size_bits('arm11', capdl.PageDirectory('pd')) == 14
+assert object_size_bits('arm11', capdl.Frame('f', 64 * 1024)) == 16
+assert object_size_bits('arm11', capdl.CNode('c', 8)) == 12
+assert object_size_bits('arm11', capdl.IRQ('irq')) is None
+
+spec = capdl.Spec('arm11')
+tcb = capdl.TCB('tcb')
+pd = capdl.PageDirectory('pd')
+frames = [capdl.Frame('frame%d' % i) for i in range(6)]
+eps = [capdl.Endpoint('ep%d' % i) for i in range(3)]
+device = capdl.Frame('uart', paddr=0x10001000)
+for o in [tcb, pd, device] + frames + eps + [capdl.IRQ('irq')]:
+    spec.add_object(o)
+
+small = capdl.Untyped('small', 15)
+big = capdl.Untyped('big', 16)
+devices = capdl.Untyped('devices', 16)
+p = plan(spec, [big, small, (devices, 0x10000000)])
+assert p.fits(), p
+
+# Objects are placed largest first, smallest untyped first, and each is
+# aligned to its size.
+assert p.placements[pd] == (small, 0)
+assert [p.placements[f] for f in frames] == \
+    [(small, 0x4000), (small, 0x5000), (small, 0x6000), (small, 0x7000),
+     (big, 0), (big, 0x1000)]
+assert p.placements[tcb] == (big, 0x2000)
+assert p.placements[eps[0]] == (big, 0x2200)
+assert p.contents[small] == [pd] + frames[:4]
+
+# Device frames are placed at their address, in an untyped of their own.
+assert p.placements[device] == (devices, 0x1000)
+assert p.contents[devices] == [device]
+
+used = (1 << 14) + 6 * 4096 + 512 + 3 * 16
+assert p.used == used + 4096
+assert p.headroom == (1 << 15) + (1 << 16) - used
+assert p.largest_free == 0x8000
+assert 0 < p.fragmentation() < 1
+
+# Objects that do not fit are reported.
+p = plan(spec, [small])
+assert not p.fits()
+assert device in p.unplaced
+assert frames[5] in p.unplaced and tcb in p.unplaced
+assert p.headroom == 0
+
+# Large specs are planned in bulk.
+spec = capdl.Spec('ia32')
+allocator = capdl.ObjectAllocator()
+allocator.spec = spec
+allocator.alloc_many(capdl.seL4_FrameObject, 100000)
+allocator.alloc_many(capdl.seL4_EndpointObject, 100000)
+p = plan(spec, [capdl.Untyped('ut%d' % i, 29) for i in range(2)])
+assert p.fits()
+assert p.used == 100000 * 4096 + 100000 * 16
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+import capdl
+
+spec = capdl.Spec()
+tcb = capdl.TCB('tcb_foo')
+cnode = capdl.CNode('cnode_foo')
+ep = capdl.Endpoint('ep_foo')
+frame = capdl.Frame('frame_foo')
+spec.add_object(tcb, 'foo')
+spec.add_object(cnode, 'foo')
+spec.add_object(ep, 'bar')
+spec.add_object(frame)
+
+assert spec.by_name('tcb_foo') is tcb
+assert spec['ep_foo'] is ep
+assert spec.by_name('nothing') is None
+try:
+    spec['nothing']
+    assert False, 'lookup of a missing name succeeded'
+except KeyError:
+    pass
+
+assert list(spec.of_type(capdl.Frame)) == [frame]
+# Objects of each class are visited in the order their class was first
+# added, so rendering is the same from run to run.
+assert list(spec.containers()) == [tcb, cnode]
+assert list(spec.by_label('foo')) == [tcb, cnode]
+assert list(spec.by_label(None)) == [frame]
+assert spec.label_of(ep) == 'bar'
+assert list(spec) == [tcb, cnode, ep, frame]
+
+# A name shared by two objects finds the one added last.
+other = capdl.Spec()
+other.add_object(ep)
+dup = capdl.Endpoint('ep_foo')
+other.add_object(dup)
+assert other['ep_foo'] is dup
+
+# Removal updates every index.
+spec.remove_object(cnode)
+assert spec.by_name('cnode_foo') is None
+assert list(spec.containers()) == [tcb]
+assert list(spec.by_label('foo')) == [tcb]
+assert len(spec) == 3
+
+# Merging carries labels across.
+other = capdl.Spec()
+other.merge(spec)
+assert list(other) == [tcb, ep, frame]
+assert list(other.by_label('bar')) == [ep]
+
+# The object allocator finds the single IOPorts object through the index.
+allocator = capdl.ObjectAllocator()
+ports = allocator.alloc(capdl.Allocator.seL4_IA32_IOPort)
+assert allocator.alloc(capdl.Allocator.seL4_IA32_IOPort, 'other') is ports
+assert allocator['obj0'] is ports
+
+# Relabelling moves an object between labels, and labels that become empty
+# are no longer in use.
+spec.relabel(ep, 'foo')
+assert spec.label_of(ep) == 'foo'
+assert list(spec.by_label('foo')) == [tcb, ep]
+assert spec.label_count('foo') == 2
+assert spec.label_count('bar') == 0
+assert 'bar' not in list(spec.labels())
+
+# A label can be extracted as a spec of its own.
+foo = spec.extract('foo')
+assert list(foo) == [tcb, ep]
+assert foo.label_of(tcb) == 'foo'
+assert foo.arch == spec.arch
+assert len(spec) == 3
+
+# The object allocator's labels are the spec's.
+allocator.alloc(capdl.seL4_EndpointObject, 'ep', 'a')
+allocator.relabel('b', allocator['ep'])
+assert allocator.spec.label_of(allocator['ep']) == 'b'
+assert allocator['ep'] in allocator.labels['b']
+assert 'a' not in allocator.labels
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+
+import capdl
+import cPickle, pickle
+
+spec = capdl.ELF('../arm-elf/hello.bin', 'hello').get_spec()
+cnode = capdl.CNode('cnode', 4)
+ep = capdl.Endpoint('ep')
+cnode[1] = capdl.Cap(ep, read=True, write=True)
+cnode[1].set_badge(7)
+cnode[2] = capdl.Cap(cnode)
+cnode[2].set_guard_size(24)
+ports = capdl.IOPorts('ports')
+cnode['named'] = capdl.Cap(ports)
+cnode['named'].set_ports(range(0x60, 0x65))
+tcb = capdl.TCB('tcb', prio=100, domain=1)
+tcb['cspace'] = capdl.Cap(cnode)
+removed = capdl.Frame('removed')
+for obj in [cnode, ep, ports, tcb, removed]:
+    spec.add_object(obj, 'extra')
+# Leave a hole in the spec's ordered sets.
+spec.remove_object(removed)
+# Dense slots with a gap.
+pt = capdl.PageTable('pt')
+for i in range(0, 200, 2):
+    pt[i] = capdl.Cap(capdl.Frame('f%d' % i), read=True)
+spec.add_object(pt)
+
+for module in [pickle, cPickle]:
+    for protocol in range(cPickle.HIGHEST_PROTOCOL + 1):
+        copy = module.loads(module.dumps(spec, protocol))
+        assert str(copy) == str(spec)
+        assert list(copy.by_label('extra')) == \
+            [copy[x.name] for x in spec.by_label('extra')]
+        assert copy['cnode'][1].badge == 7 and copy['cnode'][1].write
+        assert copy['cnode'][2].referent is copy['cnode']
+        assert copy['cnode']['named'].ports == range(0x60, 0x65)
+        assert copy['tcb'].domain == 1
+        assert copy['pt'].slots.keys() == range(0, 200, 2)
+        assert copy['pt'].slots.max_slot() == 198
+        assert copy.by_name('removed') is None
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+
+import capdl
+
+spec = capdl.Spec()
+tcb = capdl.TCB('tcb')
+cspace = capdl.CNode('cspace', 4)
+vspace = capdl.PageDirectory('vspace')
+pt = capdl.PageTable('pt')
+frame = capdl.Frame('frame')
+ep = capdl.Endpoint('ep')
+tcb['cspace'] = capdl.Cap(cspace)
+tcb['vspace'] = capdl.Cap(vspace)
+cspace[1] = capdl.Cap(ep, read=True, write=True)
+vspace[0] = capdl.Cap(pt)
+pt[0] = capdl.Cap(frame, read=True)
+pool = capdl.ASIDPool('pool')
+pool[0] = capdl.Cap(vspace)
+irq = capdl.IRQ('irq', 3)
+aep = capdl.AsyncEndpoint('aep')
+irq.set_endpoint(aep)
+for obj in [tcb, cspace, vspace, pt, frame, ep, pool, irq, aep]:
+    spec.add_object(obj, 'used')
+
+# Objects nothing can reach.
+lost_frame = capdl.Frame('lost_frame', 64 * 1024)
+lost_ut = capdl.Untyped('lost_ut', 16)
+lost_pool = capdl.ASIDPool('lost_pool')
+lost_pd = capdl.PageDirectory('lost_pd')
+lost_pool[0] = capdl.Cap(lost_pd)
+extra = capdl.Endpoint('extra')
+for obj in [lost_frame, lost_ut, lost_pool, lost_pd, extra]:
+    spec.add_object(obj, 'unused')
+
+pruned, report = spec.prune(roots=['extra'])
+assert list(pruned) == [tcb, cspace, vspace, pt, frame, ep, pool, irq, aep,
+    extra]
+assert pruned.label_of(tcb) == 'used'
+assert pruned.label_of(extra) == 'unused'
+assert report.dropped == [lost_frame, lost_ut, lost_pool, lost_pd]
+assert report.bytes_saved == 64 * 1024 + (1 << 16) + (1 << 12) + (1 << 14)
+# The original spec is untouched.
+assert len(spec) == 14
+
+# Deep chains of CNodes are followed without recursion.
+spec = capdl.Spec()
+tcb = capdl.TCB('tcb')
+spec.add_object(tcb)
+parent = tcb
+for i in xrange(100000):
+    cnode = capdl.CNode('cnode_%d' % i, 2)
+    spec.add_object(cnode)
+    parent[0] = capdl.Cap(cnode)
+    parent = cnode
+spec.add_object(capdl.Endpoint('unreachable'))
+pruned, report = spec.prune()
+assert len(pruned) == 100001
+assert [obj.name for obj in report.dropped] == ['unreachable']
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+import capdl
+from StringIO import StringIO
+
+spec = capdl.Spec()
+s = StringIO()
+spec.write(s)
+assert s.getvalue() == str(spec) + '\n'
+assert str(spec) == 'arch arm11\n\nobjects {\n\n}\n\ncaps {\n\n}\n\n' \
+    'irq maps {\n\n}'
+
+tcb = capdl.TCB('my_tcb')
+cnode = capdl.CNode('my_cnode', 4)
+aep = capdl.AsyncEndpoint('my_aep')
+irq = capdl.IRQ('my_irq', 3)
+irq.set_endpoint(aep)
+tcb['cspace'] = capdl.Cap(cnode)
+cnode[1] = capdl.Cap(aep, read=True)
+for o in [tcb, cnode, aep, irq]:
+    spec.add_object(o)
+
+s = StringIO()
+spec.write(s)
+assert s.getvalue() == str(spec) + '\n'
+lines = list(spec.iter_lines())
+assert 'my_cnode {' in lines
+assert '0x1: my_aep (R)' in lines
+assert 'cspace: my_cnode (guard: 0, guard_size: 0)' in lines
+assert lines[-3:] == ['irq maps {', '3: my_irq', '}']
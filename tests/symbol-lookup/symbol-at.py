@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+#
+# Copyright 2014, NICTA
+#
+# This software may be distributed and modified according to the terms of
+# the BSD 2-Clause license. Note that NO WARRANTY is provided.
+# See "LICENSE_BSD2.txt" for details.
+#
+# @TAG(NICTA_BSD)
+#
+
+
+from capdl.ELF import _SymbolsByAddress
+
+syms = _SymbolsByAddress([
+    (0x1000, 0x100, 'foo'),
+    # A local label and a mapping symbol inside foo, with no size.
+    (0x1010, 0, '.Lloop'),
+    (0x1010, 0, '$a'),
+    (0x1080, 0x10, 'inner'),
+    (0x2000, 0, 'marker'),
+    (0x3000, 0x10, 'bar'),
+])
+
+assert syms.at(0xfff) is None
+assert syms.at(0x1000) == 'foo'
+assert syms.at(0x1010) in ['.Lloop', '$a']
+assert syms.at(0x1020) == 'foo'
+assert syms.at(0x1084) == 'inner'
+assert syms.at(0x1090) == 'foo'
+assert syms.at(0x10ff) == 'foo'
+assert syms.at(0x1100) is None
+assert syms.at(0x2000) == 'marker'
+assert syms.at(0x2001) is None
+assert syms.at(0x300f) == 'bar'
+assert syms.at(0x3010) is None
+assert syms.between(0x1000, 0x1080) == ['foo', '$a', '.Lloop']
+assert syms.between(0x1010, 0x2001) == ['$a', '.Lloop', 'inner', 'marker']
@@ -9,7 +9,7 @@
 # @TAG(NICTA_BSD)
 #
 
-from capdl import ELF
+from capdl import ELF, NoSymbolTable
 
 elf = ELF('unstripped.bin')
 assert elf.get_arch() == 'x86'
@@ -27,3 +27,23 @@ try:
 except:
     # Expected
     pass
+
+# The stripped binary reports why the lookup failed.
+try:
+    elf.get_symbols(['_start'])
+    assert False, 'Batch symbol lookup on a stripped binary succeeded'
+except NoSymbolTable:
+    pass
+
+elf = ELF('unstripped.bin')
+assert elf.get_symbol_vaddr('no_such_symbol') is None
+assert elf.get_symbols(['_start', 'no_such_symbol']) == \
+    {'_start':0x08048d48, 'no_such_symbol':None}
+assert '_start' in elf.get_symbols_with_prefix('_st')
+assert all(x.startswith('_st') for x in elf.get_symbols_with_prefix('_st'))
+assert elf.symbol_at(0x08048d48) == '_start'
+vaddr = elf.get_symbol_vaddr('__arch_serial_setup')
+size = elf.get_symbol_size('__arch_serial_setup')
+assert size > 0
+assert elf.symbol_at(vaddr + size - 1) == '__arch_serial_setup'
+assert '_start' in elf.get_symbols_in(0x08048d48, 0x08048d49)